@@ -0,0 +1,212 @@
+"""
+Content-addressed cache of processing results, keyed by the SHA-256 of the
+uploaded audio.
+
+Results are looked up in the database first (`LectureUpload.content_hash`).
+Results that could not be persisted there are kept in a size-bounded,
+least-recently-used directory of JSON files so a re-upload still skips the
+Deepgram and Gemini round trips.
+
+Notes are also cached on their own in the `notes_cache` table, keyed by
+(transcript hash, prompt hash, model): every pipeline run seeds it (in the
+same group-committed transaction as its result, see backend/result_writer.py), so
+regenerating notes that the current prompts and model already produced
+costs no Gemini call (see backend/regenerate.py).
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
+
+from backend.database import AsyncSessionLocal, LectureUpload, NotesCacheEntry
+from backend.metrics import track_stage
+from backend.summarizer import GEMINI_MODEL, notes_prompt_hash
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "lecture_result_cache"))
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "64"))
+
+
+class ResultCache:
+    """On-disk LRU of {"transcript", "notes"} results, bounded by total size."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.db_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}.json")
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        path = self._path(content_hash)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path, None)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def put(self, content_hash: str, transcript: str, notes: str):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"transcript": transcript, "notes": notes}, f)
+            os.replace(tmp_path, self._path(content_hash))
+            self._evict()
+        except OSError as e:
+            print(f"Warning: Failed to write result cache entry: {e}")
+
+    def discard(self, content_hash: str):
+        try:
+            os.remove(self._path(content_hash))
+        except OSError:
+            pass
+
+    def clear(self) -> int:
+        """Removes every cached entry and returns how many were deleted."""
+        removed = 0
+        for entry in self._entries():
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _entries(self):
+        try:
+            return [e for e in os.scandir(self.directory) if e.is_file() and e.name.endswith(".json")]
+        except OSError:
+            return []
+
+    def _evict(self):
+        """Deletes least-recently-used entries until the cache fits `max_bytes`."""
+        with self._lock:
+            entries = []
+            for entry in self._entries():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        size = 0
+        for entry in entries:
+            try:
+                size += entry.stat().st_size
+            except OSError:
+                pass
+        hits = self.db_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "db_hits": self.db_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "disk_entries": len(entries),
+            "disk_bytes": size,
+            "disk_max_bytes": self.max_bytes,
+        }
+
+
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB * 1024 * 1024)
+
+
+async def lookup_cached_result(db: AsyncSession, content_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns a previously computed result for this audio as
+    {"id", "transcript", "notes"} ("id" is None when the result only lives in
+    the disk cache), or None on a miss.
+    """
+    if not content_hash:
+        return None
+
+    with track_stage("cache_lookup"):
+        upload = (await db.execute(
+            select(LectureUpload)
+            .options(undefer_group("content"))
+            .where(LectureUpload.content_hash == content_hash)
+            .order_by(LectureUpload.id.desc())
+            .limit(1)
+        )).scalar_one_or_none()
+    if upload:
+        result_cache.db_hits += 1
+        return {"id": upload.id, "transcript": upload.transcript, "notes": upload.notes}
+
+    entry = result_cache.get(content_hash)
+    if entry:
+        result_cache.disk_hits += 1
+        return {"id": None, "transcript": entry["transcript"], "notes": entry["notes"]}
+
+    result_cache.misses += 1
+    return None
+
+
+NotesKey = Tuple[str, str, str]
+
+
+def notes_cache_key(transcript: str) -> NotesKey:
+    """(transcript hash, prompt hash, model) for notes generated now from `transcript`."""
+    return hashlib.sha256(transcript.encode("utf-8")).hexdigest(), notes_prompt_hash(), GEMINI_MODEL
+
+
+async def lookup_cached_notes(db: AsyncSession, key: NotesKey) -> Optional[str]:
+    transcript_hash, prompt_hash, model = key
+    return (await db.execute(
+        select(NotesCacheEntry.notes).where(
+            NotesCacheEntry.transcript_hash == transcript_hash,
+            NotesCacheEntry.prompt_hash == prompt_hash,
+            NotesCacheEntry.model == model,
+        )
+    )).scalar_one_or_none()
+
+
+def notes_cache_upsert(entries: Dict[NotesKey, str]):
+    """An INSERT of `entries` (key -> notes) into notes_cache, replacing existing entries for the same keys."""
+    now = datetime.utcnow()
+    statement = insert(NotesCacheEntry).values([
+        {"transcript_hash": transcript_hash, "prompt_hash": prompt_hash, "model": model,
+         "notes": notes, "created_at": now}
+        for (transcript_hash, prompt_hash, model), notes in entries.items()
+    ])
+    return statement.on_conflict_do_update(
+        index_elements=["transcript_hash", "prompt_hash", "model"],
+        set_={"notes": statement.excluded.notes, "created_at": statement.excluded.created_at},
+    )
+
+
+async def store_cached_notes(key: NotesKey, notes: str):
+    """Saves generated notes under `key`, replacing any earlier entry (e.g. a forced regeneration)."""
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(notes_cache_upsert({key: notes}))
+            await db.commit()
+    except Exception as e:
+        # The notes are still returned; only a later regeneration pays again
+        print(f"Warning: Failed to write notes cache entry: {e}")
@@ -0,0 +1,99 @@
+"""
+Compressed text storage for large columns (transcripts and notes).
+
+Values are stored as a BLOB of one format byte followed by the payload:
+
+    0x00  uncompressed UTF-8 (values too small to be worth compressing)
+    0x01  zlib
+    0x02  zstd (only written when the optional 'zstandard' package is installed)
+
+Rows written before compression was introduced are plain TEXT; they are
+still read as-is, and `compress_existing_rows()` in backend/database.py
+rewrites them in the new format.
+"""
+import os
+import zlib
+from typing import Optional, Union
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMAT_RAW = 0x00
+FORMAT_ZLIB = 0x01
+FORMAT_ZSTD = 0x02
+
+# "zstd" or "zlib"; zstd falls back to zlib if 'zstandard' isn't installed
+TEXT_COMPRESSION = os.getenv("TEXT_COMPRESSION", "zstd").lower()
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "6"))
+# Values shorter than this (in bytes) are stored uncompressed
+TEXT_COMPRESSION_MIN_BYTES = int(os.getenv("TEXT_COMPRESSION_MIN_BYTES", "256"))
+
+
+def compress_text(value: str) -> bytes:
+    """Encodes `value` in the versioned storage format."""
+    raw = value.encode("utf-8")
+    if len(raw) < TEXT_COMPRESSION_MIN_BYTES:
+        return bytes([FORMAT_RAW]) + raw
+
+    if TEXT_COMPRESSION == "zstd" and zstandard is not None:
+        payload = zstandard.ZstdCompressor(level=TEXT_COMPRESSION_LEVEL).compress(raw)
+        fmt = FORMAT_ZSTD
+    else:
+        payload = zlib.compress(raw, TEXT_COMPRESSION_LEVEL)
+        fmt = FORMAT_ZLIB
+
+    if len(payload) >= len(raw):
+        # Incompressible; don't pay for decompression on every read
+        return bytes([FORMAT_RAW]) + raw
+    return bytes([fmt]) + payload
+
+
+def decompress_text(value: Union[bytes, str]) -> str:
+    """Decodes a value written by compress_text (or a legacy plain-text value)."""
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value:
+        return ""
+
+    fmt, payload = value[0], value[1:]
+    if fmt == FORMAT_RAW:
+        raw = payload
+    elif fmt == FORMAT_ZLIB:
+        raw = zlib.decompress(payload)
+    elif fmt == FORMAT_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("This value is zstd-compressed; install the 'zstandard' package to read it.")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raise ValueError(f"Unknown compressed text format: {fmt:#04x}")
+    return raw.decode("utf-8")
+
+
+def is_compressed(value: Union[bytes, str, None]) -> bool:
+    """True if `value` is already in the versioned storage format."""
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+
+class CompressedText(TypeDecorator):
+    """
+    A Text-like column type that is transparently compressed on write and
+    decompressed on read. Pair it with `deferred()` so the column is only
+    fetched (and decompressed) when it's actually accessed.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return compress_text(value)
+
+    def process_result_value(self, value: Optional[Union[bytes, str]], dialect) -> Optional[str]:
+        if value is None:
+            return None
+        return decompress_text(value)
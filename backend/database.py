@@ -2,29 +2,68 @@
 Database models and setup for storing lecture upload history.
 """
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Index, Integer, LargeBinary, String, Text, DateTime, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, deferred
+from typing import AsyncIterator
 import os
+import asyncio
+
+from backend.compression import CompressedText, compress_text, decompress_text, is_compressed
 
 # Database URL - using SQLite for simplicity
 # For Vercel/serverless, use /tmp directory (writable)
 if os.getenv("VERCEL"):
     # Vercel serverless environment - use /tmp
-    DATABASE_URL = "sqlite:////tmp/lecture_notes.db"
+    DATABASE_PATH = "/tmp/lecture_notes.db"
 else:
     # Local or other environments
-    DATABASE_URL = "sqlite:///./lecture_notes.db"
+    DATABASE_PATH = "./lecture_notes.db"
+DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+# Same file through aiosqlite, used by the API endpoints
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+# SQLite tuning applied to every connection. WAL lets readers run while a
+# write is in progress; synchronous=NORMAL is durable in WAL mode and avoids
+# an fsync per commit.
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
-# Create engine
+# Create engine (background worker, scripts and schema setup)
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False},  # Needed for SQLite
     echo=False  # Set to True for SQL query logging
 )
 
-# Create session factory
+# Async engine for the API, so queries don't block the event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+    # Lets SQL (the full-text search triggers and view) read compressed columns
+    dbapi_connection.create_function("decompress_text", 1, decompress_text, deterministic=True)
+
+
+event.listen(engine, "connect", _configure_sqlite_connection)
+event.listen(async_engine.sync_engine, "connect", _configure_sqlite_connection)
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes can't be lazily reloaded in async code
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 
 # Base class for models
 Base = declarative_base()
@@ -38,15 +77,192 @@ class LectureUpload(Base):
     filename = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)  # Size in bytes
     file_type = Column(String, nullable=False)  # MIME type
-    transcript = Column(Text, nullable=False)
-    notes = Column(Text, nullable=False)
+    # Stored compressed and only loaded when accessed (undefer_group("content") to load eagerly)
+    transcript = deferred(Column(CompressedText, nullable=False), group="content")
+    notes = deferred(Column(CompressedText, nullable=False), group="content")
+    # Deepgram word timings packed by backend/timings.py (None for older uploads)
+    word_timings = deferred(Column(LargeBinary, nullable=True), group="timings")
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the uploaded audio
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Set when the row changes after it was saved (e.g. regenerated notes); part of the HTTP ETags
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # Backs the keyset-paginated history listing (newest first)
+        Index("ix_lecture_uploads_created_at_id", "created_at", "id"),
+    )
+
+
+# Job statuses for the background processing queue
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+
+
+class LectureJob(Base):
+    """Model for queued lecture processing jobs (see backend/worker.py)."""
+    __tablename__ = "lecture_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, nullable=False, default=JOB_QUEUED, index=True)
+    filename = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)  # Size in bytes
+    file_type = Column(String, nullable=False)  # MIME type
+    file_path = Column(String, nullable=False)  # Spooled audio awaiting processing
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the uploaded audio
+    upload_id = Column(Integer, nullable=True)  # LectureUpload.id once done
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_expires_at = Column(DateTime, nullable=True)  # Reclaimable after this if still running
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class NotesCacheEntry(Base):
+    """
+    Notes generated from a transcript, keyed by what produced them: the
+    transcript, the notes prompts and the Gemini model (see backend/regenerate.py).
+    """
+    __tablename__ = "notes_cache"
+
+    id = Column(Integer, primary_key=True)
+    transcript_hash = Column(String(64), nullable=False)  # SHA-256 of the transcript
+    prompt_hash = Column(String(64), nullable=False)  # summarizer.notes_prompt_hash()
+    model = Column(String, nullable=False)
+    notes = Column(CompressedText, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("transcript_hash", "prompt_hash", "model", name="uq_notes_cache_key"),
+    )
+
+
+# Columns added after the first release, as (table, column, DDL type).
+# create_all() only creates missing tables, so existing databases get these
+# through ALTER TABLE in _migrate_columns().
+ADDED_COLUMNS = [
+    ("lecture_uploads", "content_hash", "VARCHAR(64)"),
+    ("lecture_jobs", "content_hash", "VARCHAR(64)"),
+    ("lecture_uploads", "updated_at", "DATETIME"),
+    ("lecture_uploads", "word_timings", "BLOB"),
+]
+
+
+def _migrate_columns():
+    """Adds columns (and their indexes) missing from databases created by older versions."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl_type in ADDED_COLUMNS:
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+                print(f"Added column {table}.{column}")
+    # Indexes declared on the models are skipped by create_all() for existing tables
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+# Rows rewritten per transaction by compress_existing_rows()
+COMPRESSION_MIGRATION_BATCH = 200
+
+
+def compress_existing_rows() -> int:
+    """
+    Rewrites transcripts and notes stored as plain TEXT (by versions before
+    compression) in the compressed format, and returns how many rows changed.
+    The file is vacuumed afterwards so the freed pages are returned to disk.
+    """
+    migrated = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, transcript, notes FROM lecture_uploads "
+                "WHERE typeof(transcript) = 'text' OR typeof(notes) = 'text' "
+                "LIMIT :batch"
+            ), {"batch": COMPRESSION_MIGRATION_BATCH}).fetchall()
+            for upload_id, transcript, notes in rows:
+                conn.execute(text(
+                    "UPDATE lecture_uploads SET transcript = :transcript, notes = :notes WHERE id = :id"
+                ), {
+                    "id": upload_id,
+                    "transcript": transcript if is_compressed(transcript) else compress_text(transcript),
+                    "notes": notes if is_compressed(notes) else compress_text(notes),
+                })
+        migrated += len(rows)
+        if len(rows) < COMPRESSION_MIGRATION_BATCH:
+            break
+
+    if migrated:
+        print(f"Compressed {migrated} existing uploads")
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+    return migrated
+
+
+# Full-text index over transcripts and notes (see backend/search.py). It is an
+# external-content FTS5 table: it stores only the index and reads the text
+# for snippets back through the lecture_uploads_text view.
+SEARCH_TABLE = "lecture_search"
+SEARCH_DDL = [
+    """CREATE VIEW IF NOT EXISTS lecture_uploads_text AS
+       SELECT id, decompress_text(transcript) AS transcript, decompress_text(notes) AS notes
+       FROM lecture_uploads""",
+    """CREATE TRIGGER IF NOT EXISTS lecture_uploads_search_insert AFTER INSERT ON lecture_uploads BEGIN
+         INSERT INTO lecture_search(rowid, transcript, notes)
+         VALUES (new.id, decompress_text(new.transcript), decompress_text(new.notes));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS lecture_uploads_search_delete AFTER DELETE ON lecture_uploads BEGIN
+         INSERT INTO lecture_search(lecture_search, rowid, transcript, notes)
+         VALUES ('delete', old.id, decompress_text(old.transcript), decompress_text(old.notes));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS lecture_uploads_search_update AFTER UPDATE OF transcript, notes ON lecture_uploads BEGIN
+         INSERT INTO lecture_search(lecture_search, rowid, transcript, notes)
+         VALUES ('delete', old.id, decompress_text(old.transcript), decompress_text(old.notes));
+         INSERT INTO lecture_search(rowid, transcript, notes)
+         VALUES (new.id, decompress_text(new.transcript), decompress_text(new.notes));
+       END""",
+]
+
+# Set by _setup_search_index(); False if this SQLite build has no FTS5
+search_available = False
+
+
+def _setup_search_index():
+    """Creates the FTS5 index and its sync triggers, backfilling existing rows the first time."""
+    global search_available
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {"name": SEARCH_TABLE}).first() is not None
+        if not exists:
+            try:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                    "transcript, notes, content='lecture_uploads_text', content_rowid='id', "
+                    "tokenize='porter unicode61')"
+                ))
+            except Exception as e:
+                print(f"Warning: Full-text search disabled (SQLite FTS5 unavailable): {e}")
+                search_available = False
+                return
+        for statement in SEARCH_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            # Index the uploads saved before search existed
+            conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+            print("Built full-text search index")
+    search_available = True
 
 
 def init_db():
     """Initialize the database by creating all tables."""
     try:
         Base.metadata.create_all(bind=engine)
+        _migrate_columns()
+        compress_existing_rows()
+        _setup_search_index()
         print("Database initialized successfully.")
     except Exception as e:
         print(f"Database initialization error: {e}")
@@ -54,28 +270,39 @@ def init_db():
         raise
 
 
-# Track if database is initialized
-_db_initialized = False
+async def init_async_db():
+    """
+    Runs init_db() off the event loop. Called from the app lifespan (and, on
+    platforms that skip the lifespan, once from the first get_db call).
+    """
+    global _db_initialized
+    await asyncio.to_thread(init_db)
+    _db_initialized = True
+
+
+async def close_async_db():
+    """Closes the async engine's pooled connections."""
+    await async_engine.dispose()
+
 
 # Track if database is initialized
 _db_initialized = False
+_db_init_lock = asyncio.Lock()
+
 
-def get_db():
-    """Dependency function to get database session."""
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Dependency function to get an async database session."""
     global _db_initialized
-    # Initialize database on first use (for serverless environments)
     if not _db_initialized:
-        try:
-            init_db()
-            _db_initialized = True
-        except Exception as e:
-            # Already initialized or will be created on first query
-            print(f"Database init check: {e}")
-            _db_initialized = True  # Mark as attempted
-    
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+        # Serverless platforms may not run the lifespan
+        async with _db_init_lock:
+            if not _db_initialized:
+                try:
+                    await init_async_db()
+                except Exception as e:
+                    # Already initialized or will be created on first query
+                    print(f"Database init check: {e}")
+                    _db_initialized = True  # Mark as attempted
 
+    async with AsyncSessionLocal() as db:
+        yield db
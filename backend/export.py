@@ -0,0 +1,142 @@
+"""
+Streaming export of stored lectures, shared by `GET /history/export` and
+view_database.py.
+
+Rows are read through a server-side cursor in batches of EXPORT_BATCH_SIZE
+(`yield_per`), and each one is written out before the next batch is
+fetched, so memory stays flat however many lectures are stored.
+"""
+import os
+import re
+import asyncio
+import zipfile
+from datetime import datetime
+from typing import Any, AsyncIterator, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import LectureUpload
+from backend.responses import json_dumps
+
+# Rows fetched from the cursor at a time
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "100"))
+
+EXPORT_COLUMNS = (
+    LectureUpload.id,
+    LectureUpload.filename,
+    LectureUpload.file_size,
+    LectureUpload.file_type,
+    LectureUpload.created_at,
+    LectureUpload.notes,
+)
+
+_UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def filter_uploads(query: Select, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   filename: Optional[str] = None) -> Select:
+    """Restricts `query` to uploads in [since, until) whose filename contains `filename` (case-insensitive)."""
+    if since:
+        query = query.where(LectureUpload.created_at >= since)
+    if until:
+        query = query.where(LectureUpload.created_at < until)
+    if filename:
+        query = query.where(LectureUpload.filename.icontains(filename, autoescape=True))
+    return query
+
+
+def export_query(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 filename: Optional[str] = None, transcripts: bool = True, newest_first: bool = False) -> Select:
+    """
+    Uploads matching the filters, oldest first (newest first with
+    `newest_first`), fetched EXPORT_BATCH_SIZE rows at a time.
+    """
+    columns = EXPORT_COLUMNS + ((LectureUpload.transcript,) if transcripts else ())
+    query = filter_uploads(select(*columns), since, until, filename)
+    if newest_first:
+        query = query.order_by(LectureUpload.created_at.desc(), LectureUpload.id.desc())
+    else:
+        query = query.order_by(LectureUpload.created_at, LectureUpload.id)
+    return query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+def export_record(row: Any) -> dict:
+    record = {
+        "id": row.id,
+        "filename": row.filename,
+        "file_size": row.file_size,
+        "file_type": row.file_type,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "notes": row.notes,
+    }
+    if "transcript" in row._fields:
+        record["transcript"] = row.transcript
+    return record
+
+
+def markdown_name(row: Any) -> str:
+    stem = os.path.splitext(os.path.basename(row.filename or ""))[0]
+    stem = _UNSAFE_NAME_RE.sub("-", stem).strip("-.")[:80] or "lecture"
+    return f"{row.id:05d}-{stem}.md"
+
+
+def markdown_document(row: Any) -> str:
+    uploaded = row.created_at.strftime("%Y-%m-%d %H:%M:%S") if row.created_at else "Unknown"
+    parts = [
+        f"# {row.filename}\n",
+        f"- Uploaded: {uploaded}",
+        f"- Size: {row.file_size / 1024 / 1024:.2f} MB",
+        f"- Type: {row.file_type}\n",
+        f"## Notes\n\n{row.notes}\n",
+    ]
+    if "transcript" in row._fields:
+        parts.append(f"## Transcript\n\n{row.transcript}\n")
+    return "\n".join(parts)
+
+
+async def stream_uploads(db: AsyncSession, query: Select) -> AsyncIterator[Any]:
+    """Yields rows of `query` as they come off the cursor."""
+    result = await db.stream(query)
+    async for row in result:
+        yield row
+
+
+async def ndjson_export(db: AsyncSession, query: Select) -> AsyncIterator[str]:
+    """One JSON object per upload, one per line."""
+    async for row in stream_uploads(db, query):
+        yield json_dumps(export_record(row)) + "\n"
+
+
+class _ZipBuffer:
+    """Unseekable sink for ZipFile; the streamed archive is drained from it after each entry."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def zip_export(db: AsyncSession, query: Select) -> AsyncIterator[bytes]:
+    """A ZIP archive with one Markdown file per upload, produced entry by entry."""
+    buffer = _ZipBuffer()
+    # ZipFile falls back to data descriptors when the output can't seek
+    archive = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED)
+    try:
+        async for row in stream_uploads(db, query):
+            # Deflating a long transcript takes a moment; keep it off the event loop
+            await asyncio.to_thread(archive.writestr, markdown_name(row), markdown_document(row))
+            yield buffer.drain()
+    finally:
+        archive.close()
+    yield buffer.drain()
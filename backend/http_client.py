@@ -0,0 +1,56 @@
+"""
+Shared async HTTP client for upstream API calls (Deepgram).
+
+One `httpx.AsyncClient` is kept for the lifetime of the app so connections
+(and their TLS sessions) are pooled and reused across requests instead of
+being set up per call. The FastAPI lifespan opens and closes it; anything
+that runs without a lifespan (serverless, scripts) gets it lazily on first use.
+"""
+import os
+from typing import Optional
+
+import httpx
+
+# Pool limits and keep-alive for upstream connections
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 multiplexes requests over one connection; needs the optional 'h2' package
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("Warning: HTTP2_ENABLED is set but the 'h2' package is not installed; using HTTP/1.1")
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(60.0, connect=30.0),
+        )
+    return _client
+
+
+async def close_http_client():
+    """Closes the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,58 +1,88 @@
 import os
+import uuid
+import hashlib
 import tempfile
+import base64
+import zipfile
 import asyncio
-import requests
-from typing import Dict, Any, List
+import httpx
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request, Query
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from deepgram import DeepgramClient, FileSource
-from google import genai
-from google.genai.errors import APIError
-from dotenv import load_dotenv
 import aiofiles
-from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from sqlalchemy import select, delete, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
 
-from backend.database import init_db, get_db, LectureUpload
+from backend.database import (
+    init_async_db,
+    close_async_db,
+    get_db,
+    AsyncSessionLocal,
+    LectureUpload,
+    LectureJob,
+    NotesCacheEntry,
+    JOB_QUEUED,
+    JOB_DONE,
+    JOB_ERROR,
+)
+from backend.pipeline import (
+    DEEPGRAM_API_KEY,
+    DEEPGRAM_API_URL,
+    MAX_FILE_SIZE_BYTES,
+    get_max_upload_size_mb,
+    get_max_resumable_upload_size_mb,
+    DEEPGRAM_UPLOAD_MODE,
+    get_mime_type_from_filename,
+    ensure_api_keys,
+    describe_pipeline_error,
+    transcribe_audio,
+    summarize_transcript,
+    save_lecture_result,
+)
+from backend.summarizer import stream_summary
+from backend.cache import result_cache, lookup_cached_result
+from backend.http_client import get_http_client, close_http_client
+from backend.result_writer import result_writer
+from backend.rate_limit import (
+    AdmissionControlMiddleware,
+    admit_pipeline,
+    batch_admission_deadline,
+    release_pipeline,
+    client_ip,
+)
+from backend.metrics import track_stage, record_error, render_metrics, UPLOAD_BYTES, RESULTS
+from backend.search import search_enabled, search_uploads
+from backend.regenerate import regenerate_upload_notes
+from backend.timings import WordTimings
+from backend.export import export_query, ndjson_export, zip_export
+from backend.responses import (
+    CompressionMiddleware,
+    FastJSONResponse,
+    json_dumps,
+    make_etag,
+    etag_matches,
+    cache_headers,
+    not_modified,
+)
+from backend.uploads import (
+    create_upload,
+    load_upload,
+    received_chunks,
+    received_bytes,
+    format_ranges,
+    write_chunk,
+    claim_upload,
+    delete_upload,
+)
 
 # --- Configuration and Setup ---
 
-# Load environment variables from .env file
-load_dotenv()
-DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# --- Initialize Deepgram Client ---
-try:
-    if DEEPGRAM_API_KEY:
-        # Initialize Deepgram client
-        # Note: The SDK uses httpx internally with default timeouts
-        # We'll handle timeouts at the application level
-        deepgram_client = DeepgramClient(api_key=DEEPGRAM_API_KEY)
-        print("Deepgram client initialized successfully")
-    else:
-        print("Warning: DEEPGRAM_API_KEY not set")
-        deepgram_client = None
-except Exception as e:
-    print(f"Error initializing Deepgram client: {e}")
-    deepgram_client = None
-
-
-# --- Initialize Gemini Client (Correct Way) ---
-try:
-    # Initialize the client using the API key directly
-    gemini_client = genai.Client(api_key=GEMINI_API_KEY)
-except Exception as e:
-    print(f"Error initializing Gemini client: {e}")
-    gemini_client = None
-
-
-# Define constants
-# Note: Vercel has a 4.5MB limit; default to 4MB unless overridden
-MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "4"))
-MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
 ALLOWED_MIME_TYPES = [
     "audio/wav",
     "audio/mpeg", # mp3
@@ -62,29 +92,54 @@ ALLOWED_MIME_TYPES = [
     "audio/flac",
     "video/mp4", # m4a is often treated as video/mp4
 ]
-# LLM Prompt for summarization
-SUMMARIZATION_PROMPT = """
-You are an expert academic assistant. Your task is to analyze the provided lecture transcript and generate clean, structured notes.
-
-The notes must strictly follow this format:
-1.  **One-Sentence Summary**: A single, concise sentence summarizing the main topic of the lecture.
-2.  **Key Takeaways**: A bulleted list of 5 to 15 key points from the lecture.
-3.  **Key Terms/Concepts**: A list of 5 important terms or concepts introduced.
-4.  **Follow-up Questions**: A list of 3 thought-provoking questions for students to consider or research further.
-
-Lecture Transcript:
----
-{transcript}
----
-"""
+# Seconds between SSE keep-alive comments while a pipeline stage is running
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# How many files of one /process-lectures batch are processed at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Most files accepted in one batch (uploaded files or ZIP members)
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "50"))
+ZIP_MIME_TYPES = ("application/zip", "application/x-zip-compressed")
+# Archive members are typed by extension, so only these are treated as audio
+ZIP_AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".ogg", ".flac", ".mp4", ".aac", ".wma")
+# Directory where audio for queued jobs waits for the worker (must be shared with it)
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "lecture_jobs"))
+
+# Initialize database and the shared upstream HTTP client on startup
+# Note: if the platform skips the ASGI lifespan (some serverless runtimes),
+# the database is initialized on first use via the get_db dependency and the
+# HTTP client on first call
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await init_async_db()
+    except Exception as e:
+        # Log error but don't fail startup (for serverless environments)
+        print(f"Database initialization warning: {e}")
+        # Database will be initialized on first use
+    get_http_client()
+    try:
+        yield
+    finally:
+        await close_http_client()
+        # Pending results must be written before the engine goes away
+        await result_writer.close()
+        await close_async_db()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Lecture Notes MVP Backend (Deepgram + Gemini)",
     description="FastAPI service for transcribing (Deepgram) and summarizing (Gemini) lecture audio files.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# gzip/brotli for buffered JSON and HTML responses (see backend/responses.py)
+app.add_middleware(CompressionMiddleware)
+
+# Per-IP rate limiting and a cap on concurrent pipelines (see backend/rate_limit.py).
+# Added before CORS so CORS wraps it and browsers can read the 429s.
+app.add_middleware(AdmissionControlMiddleware)
+
 # Enable CORS for local development
 app.add_middleware(
     CORSMiddleware,
@@ -94,55 +149,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize database on startup
-# For Vercel/serverless, initialize lazily instead of on startup
-# Note: Vercel with Mangum uses lifespan="off", so startup events won't run
-# Database will be initialized on first use via get_db dependency
-@app.on_event("startup")
-async def startup_event():
-    try:
-        init_db()
-    except Exception as e:
-        # Log error but don't fail startup (for serverless environments)
-        print(f"Database initialization warning: {e}")
-        # Database will be initialized on first use
-
 # --- Helper Functions ---
 
-async def save_upload_file_to_temp(upload_file: UploadFile) -> str:
-    """Saves the uploaded file to a temporary location and returns the path."""
-    temp_dir = tempfile.gettempdir()
-    file_path = os.path.join(temp_dir, f"uploaded_audio_{os.getpid()}_{upload_file.filename}")
+async def save_upload_file_to_temp(upload_file: UploadFile, directory: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Saves the uploaded file to a temporary location (or `directory`, if given)
+    and returns the path and the SHA-256 hex digest of its contents, computed
+    while streaming.
+    """
+    temp_dir = directory or tempfile.gettempdir()
+    os.makedirs(temp_dir, exist_ok=True)
+    safe_name = os.path.basename(upload_file.filename or "audio")
+    file_path = os.path.join(temp_dir, f"uploaded_audio_{uuid.uuid4().hex}_{safe_name}")
 
-    async with aiofiles.open(file_path, 'wb') as out_file:
-        while content := await upload_file.read(1024 * 1024):
-            await out_file.write(content)
+    sha256 = hashlib.sha256()
+    with track_stage("upload_save"):
+        async with aiofiles.open(file_path, 'wb') as out_file:
+            while content := await upload_file.read(1024 * 1024):
+                sha256.update(content)
+                await out_file.write(content)
     
-    return file_path
+    return file_path, sha256.hexdigest()
 
-def get_mime_type_from_filename(filename: str) -> str:
-    """Determine MIME type from file extension."""
-    if not filename:
-        return "audio/mpeg"
-    
-    ext = filename.lower().split('.')[-1]
-    mime_map = {
-        'mp3': 'audio/mpeg',
-        'wav': 'audio/wav',
-        'm4a': 'audio/m4a',
-        'ogg': 'audio/ogg',
-        'flac': 'audio/flac',
-        'mp4': 'video/mp4',
-        'wma': 'audio/x-ms-wma',
-        'aac': 'audio/aac',
-    }
-    return mime_map.get(ext, 'audio/mpeg')
+async def hash_upload_file(upload_file: UploadFile) -> Tuple[int, str]:
+    """
+    Hashes the upload where the server already spooled it, without copying it
+    anywhere, and returns its size and SHA-256 hex digest.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    with track_stage("upload_save"):
+        await upload_file.seek(0)
+        while content := await upload_file.read(1024 * 1024):
+            sha256.update(content)
+            size += len(content)
+        await upload_file.seek(0)
+    return size, sha256.hexdigest()
 
 def validate_file(file: UploadFile):
     """Validates file size and MIME type."""
     # Get MIME type from content_type or filename
-    mime_type = file.content_type or get_mime_type_from_filename(file.filename)
-    
+    validate_mime_type(file.content_type or get_mime_type_from_filename(file.filename))
+
+def validate_mime_type(mime_type: str):
+    """Raises a 400 unless `mime_type` is an audio (or audio-carrying video) type we accept."""
     if mime_type not in ALLOWED_MIME_TYPES:
         # Check if it's a video file that might contain audio
         if mime_type.startswith('video/'):
@@ -159,306 +209,724 @@ def validate_file(file: UploadFile):
                 detail=f"Invalid file type: {mime_type}. Please upload an audio file (MP3, WAV, M4A, OGG, FLAC, or MP4 with audio)."
             )
 
+def check_upload_size(file_size: int):
+    """Raises a 400 if the file is over the upload limit (higher when it can be segmented)."""
+    max_size_mb = get_max_upload_size_mb()
+    if file_size > max_size_mb * 1024 * 1024:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File size exceeds the limit of {max_size_mb}MB."
+        )
+
+def check_resumable_upload_size(file_size: int):
+    """Raises a 413 if a resumable upload is over its limit (not the single-request limit)."""
+    max_size_mb = get_max_resumable_upload_size_mb()
+    if file_size > max_size_mb * 1024 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File size exceeds the limit of {max_size_mb}MB."
+        )
+
+async def run_lecture_pipeline(db: AsyncSession, file_path: Optional[str], filename: str, content_type: str,
+                               file_size: int, content_hash: str, audio_file=None) -> Dict[str, Any]:
+    """
+    Returns the stored result if this exact audio was processed before,
+    otherwise transcribes it with Deepgram, summarizes it with Gemini and saves
+    it. Returns the /process-lecture response body.
+    """
+    cached = await lookup_cached_result(db, content_hash)
+    if cached:
+        upload_id = cached["id"]
+        if upload_id is None:
+            # Only in the disk cache; persist it now that we have a chance
+            upload_id = await save_lecture_result(filename, file_size, content_type,
+                                                  cached["transcript"], cached["notes"], content_hash)
+            if upload_id is not None:
+                result_cache.discard(content_hash)
+        print(f"Cache hit for file: {filename} (ID: {upload_id})")
+        RESULTS.labels("cache").inc()
+        return {
+            "status": "ok",
+            "id": upload_id,
+            "filename": filename,
+            "transcript": cached["transcript"],
+            "notes": cached["notes"],
+            "cached": True,
+            "error": None
+        }
+
+    # Transcription using Deepgram REST API directly
+    transcript, word_timings = await transcribe_audio(file_path, filename, content_type, file_size, audio_file=audio_file)
+
+    print(f"Transcription completed. Starting summarization...")
+
+    # Summarization using Google Gemini
+    notes = await summarize_transcript(transcript)
+
+    # Save to database (or keep in the disk cache if that fails)
+    upload_id = await save_lecture_result(filename, file_size, content_type, transcript, notes, content_hash,
+                                          word_timings, notes_generated=True)
+    if upload_id is None:
+        result_cache.put(content_hash, transcript, notes)
+    RESULTS.labels("pipeline").inc()
+
+    return {
+        "status": "ok",
+        "id": upload_id,
+        "filename": filename,
+        "transcript": transcript,
+        "notes": notes,
+        "cached": False,
+        "error": None
+    }
+
 # --- API Endpoints ---
 
+FRONTEND_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend", "index.html")
+# (mtime_ns, size, body, etag) of the last frontend read
+_frontend_cache: Optional[Tuple[int, int, bytes, str]] = None
+
+def load_frontend() -> Optional[Tuple[bytes, str]]:
+    """Returns the frontend HTML and its ETag, re-reading the file only when it changed."""
+    global _frontend_cache
+    try:
+        stat = os.stat(FRONTEND_PATH)
+    except OSError:
+        return None
+    cached = _frontend_cache
+    if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+        with open(FRONTEND_PATH, "rb") as f:
+            body = f.read()
+        cached = _frontend_cache = (stat.st_mtime_ns, stat.st_size, body, make_etag(hashlib.sha256(body).hexdigest()))
+    return cached[2], cached[3]
+
 @app.get("/", response_class=HTMLResponse)
-async def get_frontend():
-    """Serves the main frontend HTML file."""
-    frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend", "index.html")
-    if not os.path.exists(frontend_path):
+async def get_frontend(request: Request):
+    """Serves the main frontend HTML file (from memory, with an ETag)."""
+    frontend = load_frontend()
+    if frontend is None:
         return HTMLResponse("<h1>Frontend not found</h1><p>Please ensure 'frontend/index.html' exists.</p>", status_code=404)
-    return FileResponse(frontend_path)
+    body, etag = frontend
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return HTMLResponse(body, headers=cache_headers(etag))
 
 @app.post("/process-lecture")
-async def process_lecture(file: UploadFile = File(...), db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def process_lecture(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
     """
     Accepts an audio file, transcribes it with Deepgram, and summarizes it with Gemini.
     Also saves the result to the database.
     """
     temp_file_path = None
-    upload_id = None
     try:
         # 1. API Key Check
-        if not DEEPGRAM_API_KEY or not deepgram_client:
-            raise HTTPException(
-                status_code=500,
-                detail="Server configuration error: DEEPGRAM_API_KEY is not set or client failed to initialize."
-            )
-        if not GEMINI_API_KEY or not gemini_client:
-            raise HTTPException(
-                status_code=500,
-                detail="Server configuration error: GEMINI_API_KEY is not set or client failed to initialize."
-            )
+        ensure_api_keys()
         
         # 2. File Validation (MIME type)
         validate_file(file)
 
-        # 3. Save file to a temporary location
-        temp_file_path = await save_upload_file_to_temp(file)
+        # 3. Save file to a temporary location, or in "stream" mode send the
+        # spooled upload straight to Deepgram without a second copy
+        if DEEPGRAM_UPLOAD_MODE == "stream":
+            file_size, content_hash = await hash_upload_file(file)
+        else:
+            temp_file_path, content_hash = await save_upload_file_to_temp(file)
+            file_size = os.path.getsize(temp_file_path)
 
-        # 4. Final File Size Check
-        file_size = os.path.getsize(temp_file_path)
-        if file_size > MAX_FILE_SIZE_BYTES:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File size exceeds the limit of {MAX_FILE_SIZE_MB}MB."
-            )
+        # 4. Final File Size Check (larger files are allowed when they can be segmented)
+        UPLOAD_BYTES.inc(file_size)
+        check_upload_size(file_size)
+        if temp_file_path is None and file_size > MAX_FILE_SIZE_BYTES:
+            # Too large for one Deepgram request: segmenting needs a file ffmpeg can read
+            temp_file_path, _ = await save_upload_file_to_temp(file)
 
-        # 5. Transcription using Deepgram REST API directly
-        # Using REST API instead of SDK for better timeout control
-        print(f"Starting transcription for file: {file.filename} ({file_size / 1024 / 1024:.2f} MB)")
-        
-        # Calculate timeout based on file size (roughly 1 minute per 10 minutes of audio + buffer)
-        # Minimum 60 seconds, maximum 15 minutes
-        estimated_timeout = max(60, min(900, int(file_size / (1024 * 1024)) * 30))
+        # 5. Cache lookup, transcription (Deepgram), summarization (Gemini) and saving
+        result = await run_lecture_pipeline(db, temp_file_path, file.filename, file.content_type, file_size,
+                                            content_hash, audio_file=None if temp_file_path else file.file)
+
+        # 6. Return success response
+        return FastJSONResponse(content=result)
+
+    except HTTPException as e:
+        # Re-raise FastAPI HTTP exceptions
+        record_error("process_lecture", e.status_code)
+        raise e
+    except Exception as e:
+        # Handle other potential errors (e.g., Deepgram/Gemini API errors, file system errors)
+        import traceback
+        print(f"An error occurred during processing: {type(e).__name__}: {e}")
+        print(traceback.format_exc())
+        status_code, user_friendly_error = describe_pipeline_error(e)
+        record_error("process_lecture", status_code)
         
+        return JSONResponse(content={
+            "status": "error",
+            "transcript": None,
+            "notes": None,
+            "error": user_friendly_error
+        }, status_code=status_code)
+    finally:
+        # Clean up the temporary file
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.remove(temp_file_path)
+                print(f"Cleaned up temporary file: {temp_file_path}")
+            except Exception as cleanup_error:
+                print(f"Warning: Failed to clean up temp file: {cleanup_error}")
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
+
+async def _run_with_heartbeat(awaitable, holder: Dict[str, Any]):
+    """
+    Awaits `awaitable` while yielding SSE comments every SSE_HEARTBEAT_SECONDS
+    so proxies don't drop the idle connection. The result lands in holder["result"].
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=SSE_HEARTBEAT_SECONDS)
+            if done:
+                holder["result"] = task.result()
+                return
+            yield ": keep-alive\n\n"
+    finally:
+        if not task.done():
+            task.cancel()
+
+@app.post("/process-lecture/stream")
+async def process_lecture_stream(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    """
+    Same pipeline as /process-lecture, but responds with a Server-Sent Events
+    stream of progress events (upload_saved, transcription_started,
+    transcription_finished, notes_delta, committed) ending in a `done` event
+    with the full result, or an `error` event.
+    """
+    ensure_api_keys()
+    validate_file(file)
+
+    # Save before streaming starts: the upload is closed once this handler returns
+    temp_file_path, content_hash = await save_upload_file_to_temp(file)
+    file_size = os.path.getsize(temp_file_path)
+    UPLOAD_BYTES.inc(file_size)
+    try:
+        check_upload_size(file_size)
+        cached = await lookup_cached_result(db, content_hash)
+    except BaseException:
+        os.remove(temp_file_path)
+        raise
+    return lecture_event_response(temp_file_path, file.filename, file.content_type, file_size, content_hash, cached)
+
+
+def lecture_event_response(temp_file_path: str, filename: str, content_type: str, file_size: int,
+                           content_hash: str, cached: Optional[Dict[str, Any]],
+                           endpoint: str = "process_lecture_stream") -> StreamingResponse:
+    """
+    Runs the pipeline on a saved upload as a Server-Sent Events response (see
+    /process-lecture/stream). The temp file is deleted once the stream ends.
+    """
+    async def event_stream():
+        upload_id = None
         try:
-            import concurrent.futures
-            
-            # Use Deepgram REST API directly with requests library for better control
-            def call_deepgram_rest_api():
-                url = "https://api.deepgram.com/v1/listen"
-                headers = {
-                    "Authorization": f"Token {DEEPGRAM_API_KEY}",
-                }
-                
-                # Determine MIME type from content_type or filename
-                mime_type = file.content_type or get_mime_type_from_filename(file.filename)
-                print(f"Detected MIME type: {mime_type} for file: {file.filename}")
-                
-                # Read file data
-                with open(temp_file_path, "rb") as audio_file:
-                    audio_data = audio_file.read()
-                
-                # Verify file is not empty
-                if len(audio_data) == 0:
-                    raise ValueError("Uploaded file is empty")
-                
-                # Try sending as multipart/form-data first (preferred method)
+            yield sse_event("upload_saved", {"filename": filename, "file_size": file_size})
+
+            if cached:
+                upload_id = cached["id"]
+                transcript, notes = cached["transcript"], cached["notes"]
+                if upload_id is None:
+                    upload_id = await save_lecture_result(filename, file_size, content_type,
+                                                          transcript, notes, content_hash)
+                    if upload_id is not None:
+                        result_cache.discard(content_hash)
+                RESULTS.labels("cache").inc()
+                yield sse_event("done", {
+                    "status": "ok", "id": upload_id, "filename": filename,
+                    "transcript": transcript, "notes": notes, "cached": True, "error": None
+                })
+                return
+
+            yield sse_event("transcription_started", {})
+            holder: Dict[str, Any] = {}
+            async for heartbeat in _run_with_heartbeat(
+                transcribe_audio(temp_file_path, filename, content_type, file_size), holder
+            ):
+                yield heartbeat
+            transcript, word_timings = holder["result"]
+            yield sse_event("transcription_finished", {"transcript": transcript})
+
+            yield sse_event("summary_started", {})
+            pieces = []
+            async for piece in stream_summary(transcript):
+                pieces.append(piece)
+                yield sse_event("notes_delta", {"text": piece})
+            notes = "".join(pieces).strip()
+
+            upload_id = await save_lecture_result(filename, file_size, content_type, transcript, notes,
+                                                  content_hash, word_timings, notes_generated=True)
+            if upload_id is None:
+                result_cache.put(content_hash, transcript, notes)
+            RESULTS.labels("pipeline").inc()
+            yield sse_event("committed", {"id": upload_id})
+
+            yield sse_event("done", {
+                "status": "ok", "id": upload_id, "filename": filename,
+                "transcript": transcript, "notes": notes, "cached": False, "error": None
+            })
+        except HTTPException as e:
+            record_error(endpoint, e.status_code)
+            yield sse_event("error", {"status": "error", "status_code": e.status_code, "error": e.detail})
+        except Exception as e:
+            import traceback
+            print(f"An error occurred during processing: {type(e).__name__}: {e}")
+            print(traceback.format_exc())
+            status_code, user_friendly_error = describe_pipeline_error(e)
+            record_error(endpoint, status_code)
+            yield sse_event("error", {"status": "error", "status_code": status_code, "error": user_friendly_error})
+        finally:
+            if os.path.exists(temp_file_path):
                 try:
-                    files = {
-                        "audio": (file.filename or "audio.mp3", audio_data, mime_type)
-                    }
-                    
-                    params = {
-                        "model": "nova-2",
-                        "smart_format": "true",
-                    }
-                    
-                    print(f"Uploading to Deepgram API as multipart/form-data (timeout: {estimated_timeout}s)...")
-                    response = requests.post(
-                        url,
-                        headers=headers,
-                        files=files,
-                        params=params,
-                        timeout=(30, estimated_timeout)
+                    os.remove(temp_file_path)
+                except Exception as cleanup_error:
+                    print(f"Warning: Failed to clean up temp file: {cleanup_error}")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def is_zip_upload(upload: UploadFile) -> bool:
+    return upload.content_type in ZIP_MIME_TYPES or (upload.filename or "").lower().endswith(".zip")
+
+def list_zip_audio_members(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Returns the archive's files, skipping directories and macOS metadata."""
+    members = []
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+            continue
+        members.append(info)
+    return members
+
+def extract_zip_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int) -> Tuple[str, str, int]:
+    """
+    Streams one archive member to a temp file (never holding it in memory)
+    and returns its path, SHA-256 and size. Stops with a 400 once more than
+    `max_bytes` come out, whatever the archive claims the size is.
+    """
+    name = os.path.basename(info.filename)
+    file_path = os.path.join(tempfile.gettempdir(), f"uploaded_audio_{uuid.uuid4().hex}_{name}")
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with archive.open(info) as source, open(file_path, "wb") as out_file:
+            while content := source.read(1024 * 1024):
+                size += len(content)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File size exceeds the limit of {max_bytes // (1024 * 1024)}MB."
                     )
-                    
-                    response.raise_for_status()
-                    return response.json()
-                except requests.exceptions.HTTPError as e:
-                    # If multipart fails with "corrupt or unsupported", try sending as raw bytes
-                    if e.response.status_code == 400:
-                        error_data = e.response.json() if e.response.headers.get('content-type', '').startswith('application/json') else {}
-                        if "corrupt" in str(error_data).lower() or "unsupported" in str(error_data).lower():
-                            print("Multipart upload failed, trying raw bytes upload...")
-                            # Try sending as raw bytes with Content-Type header
-                            headers_with_content = headers.copy()
-                            headers_with_content["Content-Type"] = mime_type
-                            
-                            params = {
-                                "model": "nova-2",
-                                "smart_format": "true",
-                            }
-                            
-                            response = requests.post(
-                                url,
-                                headers=headers_with_content,
-                                data=audio_data,
-                                params=params,
-                                timeout=(30, estimated_timeout)
-                            )
-                            response.raise_for_status()
-                            return response.json()
-                    raise
-            
-            # Run in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                result = await asyncio.wait_for(
-                    loop.run_in_executor(executor, call_deepgram_rest_api),
-                    timeout=estimated_timeout + 60  # Add buffer for processing
-                )
-            
-            print("Deepgram API call completed successfully")
-            
-            # Extract transcript from response
-            if "results" in result and "channels" in result["results"]:
-                transcript = result["results"]["channels"][0]["alternatives"][0]["transcript"]
-            else:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Unexpected response format from Deepgram API"
-                )
-                
-        except asyncio.TimeoutError:
-            raise HTTPException(
-                status_code=504,
-                detail=f"Transcription timeout: The Deepgram API took longer than {estimated_timeout // 60} minutes to respond. This might be due to a very large file. Please try with a smaller file or split the audio into segments."
-            )
-        except requests.exceptions.Timeout as e:
-            raise HTTPException(
-                status_code=504,
-                detail=f"Connection timeout: Unable to connect to Deepgram API within 30 seconds. Please check your internet connection, firewall settings, and ensure api.deepgram.com is accessible."
-            )
-        except requests.exceptions.ConnectionError as e:
-            raise HTTPException(
-                status_code=503,
-                detail=f"Connection error: Unable to reach Deepgram API. Please check your internet connection and ensure api.deepgram.com is accessible. Error: {str(e)}"
-            )
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                raise HTTPException(
-                    status_code=401,
-                    detail="Authentication error: Invalid Deepgram API key. Please check your .env file."
-                )
-            elif e.response.status_code == 400:
-                # Try to parse error message
+                sha256.update(content)
+                out_file.write(content)
+    except BaseException:
+        os.remove(file_path)
+        raise
+    return file_path, sha256.hexdigest(), size
+
+def describe_batch_error(e: Exception) -> Tuple[int, str]:
+    if isinstance(e, HTTPException):
+        status_code, error = e.status_code, e.detail
+    elif isinstance(e, zipfile.BadZipFile):
+        status_code, error = 400, f"Corrupt ZIP archive: {e}"
+    else:
+        print(f"An error occurred during processing: {type(e).__name__}: {e}")
+        status_code, error = describe_pipeline_error(e)
+    record_error("process_lectures", status_code)
+    return status_code, error
+
+@app.post("/process-lectures")
+async def process_lectures(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Batch version of /process-lecture: accepts several audio files, or one
+    ZIP archive of them, and runs up to BATCH_CONCURRENCY through the pipeline
+    at once. Responds with NDJSON: one `{"type": "result", ...}` line per file
+    as it finishes (in completion order, with its `index` in the batch),
+    then a `{"type": "summary", ...}` line.
+
+    Each file is admitted on its own when it starts (a rate-limit token and
+    a pipeline slot), waiting for them if needed; only a file that can't be
+    admitted within BATCH_ADMISSION_TIMEOUT_SECONDS gets a 429 result line
+    with `retry_after`, and the rest of the batch carries on.
+    """
+    ensure_api_keys()
+    if len(files) == 1 and is_zip_upload(files[0]):
+        # The upload is closed once this handler returns, so keep a copy to unpack from
+        zip_path, _ = await save_upload_file_to_temp(files[0])
+        uploads = []
+    elif any(is_zip_upload(f) for f in files):
+        raise HTTPException(status_code=400, detail="Upload either audio files or a single ZIP archive, not both.")
+    elif len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {MAX_BATCH_FILES} files.")
+    else:
+        zip_path = None
+        uploads = []
+        try:
+            for upload in files:
                 try:
-                    error_data = e.response.json()
-                    error_msg = error_data.get("err_msg", e.response.text)
-                    if "corrupt" in error_msg.lower() or "unsupported" in error_msg.lower():
-                        raise HTTPException(
-                            status_code=400,
-                            detail=f"Audio file error: {error_msg}. Please ensure the file is a valid, uncorrupted audio file. Supported formats: MP3, WAV, M4A, OGG, FLAC, MP4 (with audio). Try converting the file to MP3 format."
-                        )
-                except:
-                    pass
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Deepgram API error: {e.response.text}. Please check that your audio file is valid and in a supported format (MP3, WAV, M4A, OGG, FLAC, or MP4 with audio)."
-                )
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=f"Deepgram API error: {e.response.text}"
-            )
-        except Exception as e:
-            error_msg = str(e)
-            error_type = type(e).__name__
-            print(f"Deepgram API error: {error_type}: {error_msg}")
-            
-            if "timeout" in error_msg.lower():
-                raise HTTPException(
-                    status_code=504,
-                    detail=f"Transcription timeout: {error_msg}. Try with a smaller file or check your internet connection."
-                )
-            elif "connection" in error_msg.lower() or "connect" in error_msg.lower():
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"Connection error: Unable to connect to Deepgram API. Please check your internet connection and firewall settings. Error: {error_msg}"
-                )
+                    validate_file(upload)
+                    file_path, content_hash = await save_upload_file_to_temp(upload)
+                    uploads.append((upload.filename, upload.content_type, file_path, content_hash, None))
+                except HTTPException as e:
+                    uploads.append((upload.filename, upload.content_type, None, None, e))
+        except BaseException:
+            for _, _, file_path, _, _ in uploads:
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
             raise
-        
-        if not transcript:
-            raise HTTPException(
-                status_code=400,
-                detail="Transcription failed or returned empty text. The audio file might be silent or corrupted."
-            )
 
-        print(f"Transcription completed. Starting summarization...")
+    max_bytes = get_max_upload_size_mb() * 1024 * 1024
 
-        # 6. Summarization using Google Gemini
-        formatted_prompt = SUMMARIZATION_PROMPT.format(transcript=transcript)
-        
-        # Using gemini-2.5-flash for fast and capable summarization
-        chat_response = gemini_client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=formatted_prompt
-        )
-        
-        notes = chat_response.text.strip()
+    client = client_ip(request.scope)
+    admission_deadline = batch_admission_deadline()
 
-        # 7. Save to database
+    async def process_one(index: int, filename: str, content_type: str, file_path: str, content_hash: str) -> Dict[str, Any]:
+        slot = None
         try:
-            db_upload = LectureUpload(
-                filename=file.filename or "unknown",
-                file_size=file_size,
-                file_type=file.content_type or "unknown",
-                transcript=transcript,
-                notes=notes
-            )
-            db.add(db_upload)
-            db.commit()
-            db.refresh(db_upload)
-            upload_id = db_upload.id
-            print(f"Saved upload to database with ID: {upload_id}")
-        except Exception as db_error:
-            print(f"Warning: Failed to save to database: {db_error}")
-            # Continue even if database save fails
-
-        # 8. Return success response
-        return JSONResponse(content={
-            "status": "ok",
-            "id": upload_id,
-            "filename": file.filename,
-            "transcript": transcript,
-            "notes": notes,
-            "error": None
-        })
+            file_size = os.path.getsize(file_path)
+            UPLOAD_BYTES.inc(file_size)
+            check_upload_size(file_size)
+            slot = await admit_pipeline(client, admission_deadline)
+            async with AsyncSessionLocal() as db:
+                result = await run_lecture_pipeline(db, file_path, filename, content_type, file_size, content_hash)
+            return {"type": "result", "index": index, "status_code": 200, **result}
+        except Exception as e:
+            status_code, error = describe_batch_error(e)
+            line = {"type": "result", "index": index, "status": "error", "status_code": status_code,
+                    "filename": filename, "error": error}
+            if isinstance(e, HTTPException) and e.headers and "Retry-After" in e.headers:
+                line["retry_after"] = int(e.headers["Retry-After"])
+            return line
+        finally:
+            await release_pipeline(slot)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    async def ndjson_stream():
+        results: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        tasks: List[asyncio.Task] = []
+
+        async def run(index: int, *args):
+            try:
+                await results.put(await process_one(index, *args))
+            finally:
+                semaphore.release()
+
+        def reject(index: int, filename: str, e: Exception):
+            status_code, error = describe_batch_error(e)
+            results.put_nowait({"type": "result", "index": index, "status": "error",
+                                "status_code": status_code, "filename": filename, "error": error})
+
+        async def produce():
+            # Files start as soon as a slot frees up; ZIP members are unpacked one at a time on demand
+            try:
+                if zip_path is None:
+                    for index, (filename, content_type, file_path, content_hash, error) in enumerate(uploads):
+                        if error is not None:
+                            reject(index, filename, error)
+                            continue
+                        await semaphore.acquire()
+                        tasks.append(asyncio.create_task(run(index, filename, content_type, file_path, content_hash)))
+                else:
+                    archive = await asyncio.to_thread(zipfile.ZipFile, zip_path)
+                    try:
+                        members = list_zip_audio_members(archive)
+                        if len(members) > MAX_BATCH_FILES:
+                            raise HTTPException(status_code=400,
+                                                detail=f"A batch can contain at most {MAX_BATCH_FILES} files.")
+                        for index, info in enumerate(members):
+                            filename = os.path.basename(info.filename)
+                            content_type = get_mime_type_from_filename(filename)
+                            await semaphore.acquire()
+                            try:
+                                if not filename.lower().endswith(ZIP_AUDIO_EXTENSIONS):
+                                    raise HTTPException(status_code=400, detail=f"Not an audio file: {filename}")
+                                validate_mime_type(content_type)
+                                file_path, content_hash, _ = await asyncio.to_thread(
+                                    extract_zip_member, archive, info, max_bytes
+                                )
+                            except Exception as e:
+                                semaphore.release()
+                                reject(index, filename, e)
+                                continue
+                            tasks.append(asyncio.create_task(run(index, filename, content_type, file_path, content_hash)))
+                    finally:
+                        archive.close()
+            except Exception as e:
+                status_code, error = describe_batch_error(e)
+                results.put_nowait({"type": "error", "status": "error", "status_code": status_code, "error": error})
+            await asyncio.gather(*tasks)
+            results.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        total = 0
+        succeeded = 0
+        try:
+            while (line := await results.get()) is not None:
+                if line["type"] == "result":
+                    total += 1
+                    succeeded += line["status"] == "ok"
+                yield json_dumps(line) + "\n"
+
+            yield json_dumps({"type": "summary", "status": "ok", "total": total,
+                              "succeeded": succeeded, "failed": total - succeeded}) + "\n"
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(producer, *tasks, return_exceptions=True)
+            for _, _, file_path, _, _ in uploads:
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
+            if zip_path and os.path.exists(zip_path):
+                os.remove(zip_path)
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
+async def queue_lecture_job(db: AsyncSession, file_path: str, filename: str, content_type: str,
+                            file_size: int, content_hash: str) -> LectureJob:
+    """Queues audio already saved in JOB_SPOOL_DIR for the background worker."""
+    job = LectureJob(
+        status=JOB_QUEUED,
+        filename=filename or "unknown",
+        file_size=file_size,
+        file_type=content_type or get_mime_type_from_filename(filename),
+        file_path=file_path,
+        content_hash=content_hash,
+    )
+    db.add(job)
+    await db.commit()
+    print(f"Queued job {job.id} for file: {job.filename}")
+    return job
+
+@app.post("/jobs", status_code=202)
+async def submit_lecture_job(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    """
+    Accepts an audio file and queues it for background processing by
+    `python -m backend.worker`. Returns a job ID immediately; poll
+    `/jobs/{job_id}` for the result.
+    """
+    file_path = None
+    try:
+        ensure_api_keys()
+        validate_file(file)
+
+        file_path, content_hash = await save_upload_file_to_temp(file, directory=JOB_SPOOL_DIR)
+        file_size = os.path.getsize(file_path)
+        UPLOAD_BYTES.inc(file_size)
+        check_upload_size(file_size)
+
+        job = await queue_lecture_job(db, file_path, file.filename, file.content_type, file_size, content_hash)
 
-    except HTTPException as e:
-        # Re-raise FastAPI HTTP exceptions
-        raise e
-    except asyncio.TimeoutError:
-        # Handle timeout errors
-        print("Transcription timeout error")
         return JSONResponse(content={
-            "status": "error",
-            "transcript": None,
-            "notes": None,
-            "error": "Transcription timeout: The Deepgram API took too long to respond. Please check your internet connection and try again with a smaller file."
-        }, status_code=504)
-    except APIError as e:
-        # Handle Gemini API errors
-        print(f"Gemini API Error: {e}")
+            "status": "ok",
+            "job_id": job.id,
+            "job_status": job.status,
+        }, status_code=202)
+    except Exception as e:
+        # The worker will never see this file, so don't leave it in the spool
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        if isinstance(e, HTTPException):
+            raise
+        await db.rollback()
+        print(f"Error queueing job: {e}")
         return JSONResponse(content={
             "status": "error",
-            "transcript": None,
-            "notes": None,
-            "error": f"Gemini API Error: {str(e)}"
+            "error": str(e)
         }, status_code=500)
+
+
+@app.get("/jobs/{job_id}")
+async def get_lecture_job(job_id: int, db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    """
+    Returns the status of a queued job, and its transcript and notes once done.
+    """
+    job = await db.get(LectureJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    content = {
+        "status": "ok",
+        "job_id": job.id,
+        "job_status": job.status,
+        "filename": job.filename,
+        "attempts": job.attempts,
+        "id": job.upload_id,
+        "transcript": None,
+        "notes": None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+    if job.status == JOB_DONE and job.upload_id is not None:
+        upload = await db.get(LectureUpload, job.upload_id, options=[undefer_group("content")])
+        if upload:
+            content["transcript"] = upload.transcript
+            content["notes"] = upload.notes
+    return JSONResponse(content=content)
+
+
+# --- Resumable Uploads ---
+
+class ResumableUploadRequest(BaseModel):
+    filename: str
+    size: int
+    content_type: Optional[str] = None
+    # Optional: a smaller chunk size than the server's default
+    chunk_size: Optional[int] = None
+    # Optional: SHA-256 hex digest of the whole file, checked on finalize
+    sha256: Optional[str] = None
+
+def resumable_upload_status(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    received = received_chunks(manifest)
+    return {
+        "status": "ok",
+        "upload_id": manifest["upload_id"],
+        "filename": manifest["filename"],
+        "size": manifest["size"],
+        "chunk_size": manifest["chunk_size"],
+        "total_chunks": manifest["total_chunks"],
+        "received_chunks": format_ranges(received),
+        "received_count": len(received),
+        "offset": received_bytes(manifest, received),
+        "complete": len(received) == manifest["total_chunks"],
+        "error": None,
+    }
+
+def resumable_upload_headers(status: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "Upload-Length": str(status["size"]),
+        "Upload-Offset": str(status["offset"]),
+        "Upload-Chunk-Size": str(status["chunk_size"]),
+        "Upload-Received-Chunks": status["received_chunks"],
+        "Cache-Control": "no-store",
+    }
+
+@app.post("/uploads", status_code=201)
+async def create_resumable_upload(request: ResumableUploadRequest) -> Dict[str, Any]:
+    """
+    Starts a resumable upload for files too large (or connections too flaky)
+    for a single request. PUT the chunks to /uploads/{upload_id}/chunks/{index},
+    then POST /uploads/{upload_id}/finalize.
+    """
+    ensure_api_keys()
+    content_type = request.content_type or get_mime_type_from_filename(request.filename)
+    validate_mime_type(content_type)
+    # Refuse up front what finalize couldn't process, before any chunk is sent
+    check_resumable_upload_size(request.size)
+    manifest = await asyncio.to_thread(
+        create_upload, request.filename, content_type, request.size, request.chunk_size, request.sha256
+    )
+    status = resumable_upload_status(manifest)
+    headers = resumable_upload_headers(status)
+    headers["Location"] = f"/uploads/{manifest['upload_id']}"
+    return JSONResponse(content=status, status_code=201, headers=headers)
+
+@app.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"])
+async def get_resumable_upload(upload_id: str) -> Dict[str, Any]:
+    """
+    Reports which chunks have arrived, in the body and in the Upload-* headers
+    (so a HEAD request is enough to resume).
+    """
+    status = resumable_upload_status(load_upload(upload_id))
+    return JSONResponse(content=status, headers=resumable_upload_headers(status))
+
+@app.put("/uploads/{upload_id}/chunks/{index}")
+async def put_resumable_upload_chunk(upload_id: str, index: int, request: Request,
+                                     offset: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Stores chunk `index` (the raw request body) at byte offset index * chunk_size.
+    Idempotent: sending a chunk again overwrites it. `offset`, if given, must match.
+    """
+    manifest = load_upload(upload_id)
+    await write_chunk(manifest, index, request.stream(), offset)
+    return {"status": "ok", "upload_id": upload_id, "index": index, "error": None}
+
+@app.delete("/uploads/{upload_id}")
+async def cancel_resumable_upload(upload_id: str) -> Dict[str, Any]:
+    """Abandons an unfinished upload and deletes what was received."""
+    await asyncio.to_thread(delete_upload, upload_id)
+    return {"status": "ok", "error": None}
+
+@app.post("/uploads/{upload_id}/finalize")
+async def finalize_resumable_upload(upload_id: str, mode: str = "sync", db: AsyncSession = Depends(get_db)):
+    """
+    Hands a fully received upload to the pipeline. `mode` picks the response:
+    "sync" (the /process-lecture JSON), "stream" (the /process-lecture/stream
+    events) or "job" (queued like /jobs). Responds 409 with the missing chunks
+    if the upload is incomplete, and 413 (leaving the upload in place) if it
+    is over the resumable upload limit.
+    """
+    if mode not in ("sync", "stream", "job"):
+        raise HTTPException(status_code=400, detail="mode must be 'sync', 'stream' or 'job'.")
+    ensure_api_keys()
+    manifest = load_upload(upload_id)
+    # Checked again here: ffmpeg (and with it the segmented limit) may be gone since the upload started
+    check_resumable_upload_size(manifest["size"])
+    file_path, content_hash = await claim_upload(manifest, JOB_SPOOL_DIR if mode == "job" else None)
+    filename, content_type, file_size = manifest["filename"], manifest["content_type"], manifest["size"]
+    UPLOAD_BYTES.inc(file_size)
+
+    if mode == "stream":
+        try:
+            cached = await lookup_cached_result(db, content_hash)
+        except BaseException:
+            os.remove(file_path)
+            raise
+        return lecture_event_response(file_path, filename, content_type, file_size, content_hash, cached,
+                                      endpoint="finalize_upload")
+
+    if mode == "job":
+        try:
+            job = await queue_lecture_job(db, file_path, filename, content_type, file_size, content_hash)
+        except Exception as e:
+            os.remove(file_path)
+            await db.rollback()
+            print(f"Error queueing job: {e}")
+            return JSONResponse(content={"status": "error", "error": str(e)}, status_code=500)
+        return JSONResponse(content={
+            "status": "ok",
+            "job_id": job.id,
+            "job_status": job.status,
+        }, status_code=202)
+
+    try:
+        result = await run_lecture_pipeline(db, file_path, filename, content_type, file_size, content_hash)
+        return FastJSONResponse(content=result)
+    except HTTPException as e:
+        record_error("finalize_upload", e.status_code)
+        raise
     except Exception as e:
-        # Handle other potential errors (e.g., Deepgram API errors, file system errors)
         import traceback
-        error_type = type(e).__name__
-        error_msg = str(e)
-        print(f"An error occurred during processing: {error_type}: {error_msg}")
+        print(f"An error occurred during processing: {type(e).__name__}: {e}")
         print(traceback.format_exc())
-        
-        # Provide more helpful error messages for common issues
-        if "timeout" in error_msg.lower() or "handshake" in error_msg.lower() or "ConnectTimeout" in error_type:
-            user_friendly_error = "Connection timeout: Unable to connect to Deepgram API. Please check your internet connection and ensure your API key is valid."
-        elif "SSL" in error_msg or "certificate" in error_msg.lower():
-            user_friendly_error = "SSL connection error: There was a problem establishing a secure connection. Please check your network settings."
-        elif "401" in error_msg or "unauthorized" in error_msg.lower():
-            user_friendly_error = "Authentication error: Invalid Deepgram API key. Please check your .env file."
-        else:
-            user_friendly_error = f"Processing failed: {error_type}: {error_msg}"
-        
+        status_code, user_friendly_error = describe_pipeline_error(e)
+        record_error("finalize_upload", status_code)
         return JSONResponse(content={
             "status": "error",
             "transcript": None,
             "notes": None,
             "error": user_friendly_error
-        }, status_code=500)
+        }, status_code=status_code)
     finally:
-        # Clean up the temporary file
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                print(f"Cleaned up temporary file: {temp_file_path}")
-            except Exception as cleanup_error:
-                print(f"Warning: Failed to clean up temp file: {cleanup_error}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
 
 
 @app.get("/test-deepgram")
@@ -473,42 +941,35 @@ async def test_deepgram_connection():
         }, status_code=500)
     
     try:
-        import concurrent.futures
-        
-        def test_connection():
-            # Test connection to Deepgram API
-            url = "https://api.deepgram.com/v1/projects"
-            headers = {
-                "Authorization": f"Token {DEEPGRAM_API_KEY}",
-            }
-            
-            response = requests.get(url, headers=headers, timeout=(10, 10))
-            response.raise_for_status()
-            return response.json()
-        
-        loop = asyncio.get_event_loop()
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            result = await asyncio.wait_for(
-                loop.run_in_executor(executor, test_connection),
-                timeout=15.0
-            )
+        # Test connection to Deepgram API
+        url = f"{DEEPGRAM_API_URL}/v1/projects"
+        headers = {
+            "Authorization": f"Token {DEEPGRAM_API_KEY}",
+        }
+
+        response = await asyncio.wait_for(
+            get_http_client().get(url, headers=headers, timeout=httpx.Timeout(10.0)),
+            timeout=15.0
+        )
+        response.raise_for_status()
+        result = response.json()
         
         return JSONResponse(content={
             "status": "ok",
             "message": "Deepgram API connection successful.",
             "projects": len(result.get("projects", [])) if isinstance(result, dict) else 0
         })
-    except requests.exceptions.Timeout:
+    except (httpx.TimeoutException, asyncio.TimeoutError):
         return JSONResponse(content={
             "status": "error",
             "message": "Connection timeout: Unable to reach Deepgram API within 10 seconds. Check your internet connection."
         }, status_code=504)
-    except requests.exceptions.ConnectionError as e:
+    except httpx.TransportError as e:
         return JSONResponse(content={
             "status": "error",
             "message": f"Connection error: Unable to reach Deepgram API. Check your internet connection and firewall. Error: {str(e)}"
         }, status_code=503)
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         if e.response.status_code == 401:
             return JSONResponse(content={
                 "status": "error",
@@ -525,31 +986,127 @@ async def test_deepgram_connection():
         }, status_code=500)
 
 
+@app.get("/cache/stats")
+async def get_cache_stats() -> Dict[str, Any]:
+    """
+    Returns hit/miss counters for the duplicate-upload result cache.
+    """
+    return JSONResponse(content={
+        "status": "ok",
+        **result_cache.stats()
+    })
+
+
+# Columns returned by the lightweight history listing (no transcript/notes)
+HISTORY_LIST_COLUMNS = (
+    LectureUpload.id,
+    LectureUpload.filename,
+    LectureUpload.file_size,
+    LectureUpload.file_type,
+    LectureUpload.created_at,
+    LectureUpload.updated_at,
+)
+# What the history ETags are derived from
+HISTORY_VERSION_COLUMNS = (LectureUpload.id, LectureUpload.created_at, LectureUpload.updated_at)
+MAX_HISTORY_LIMIT = 200
+
+def history_etag(*parts: Any, rows) -> str:
+    """Strong ETag for a history response: changes whenever a row on it is added, edited or deleted."""
+    return make_etag(*parts, *((row.id, row.created_at, row.updated_at) for row in rows))
+
+def encode_history_cursor(created_at: datetime, upload_id: int) -> str:
+    """Encodes the (created_at, id) keyset position of the last row on a page."""
+    raw = f"{created_at.isoformat()}|{upload_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decodes a cursor from encode_history_cursor, raising a 400 if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, upload_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(upload_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid history cursor.")
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics: per-stage latency histograms (upload_save,
+    cache_lookup, transcription, summarization, db_commit), in-flight gauges,
+    error counters by class and bytes uploaded.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/history")
-async def get_history(db: Session = Depends(get_db), limit: int = 50) -> Dict[str, Any]:
+async def get_history(request: Request, db: AsyncSession = Depends(get_db), limit: int = 50, mode: str = "full",
+                      cursor: Optional[str] = None) -> Dict[str, Any]:
     """
-    Retrieves the upload history from the database.
+    Retrieves the upload history from the database, newest first.
+
+    `mode=list` returns only id, filename, size, type and created_at (fetch
+    full transcripts and notes from /history/{upload_id}). Pages are keyed on
+    (created_at, id): pass the returned `next_cursor` as `cursor` to get the
+    next page. Responses carry an ETag; a poll with a matching If-None-Match
+    gets an empty 304.
     """
+    if mode not in ("full", "list"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'list'.")
+    limit = max(1, min(limit, MAX_HISTORY_LIMIT))
+    position = decode_history_cursor(cursor) if cursor else None
+
+    def page(query):
+        if position:
+            created_at, upload_id = position
+            query = query.where(or_(
+                LectureUpload.created_at < created_at,
+                and_(LectureUpload.created_at == created_at, LectureUpload.id < upload_id),
+            ))
+        # Fetch one extra row to know whether there is a next page
+        return query.order_by(LectureUpload.created_at.desc(), LectureUpload.id.desc()).limit(limit + 1)
+
     try:
-        uploads = db.query(LectureUpload).order_by(LectureUpload.created_at.desc()).limit(limit).all()
+        if mode == "list":
+            uploads = (await db.execute(page(select(*HISTORY_LIST_COLUMNS)))).all()
+        else:
+            # Check the page's ids and timestamps first, so an unchanged page
+            # is answered without loading (and decompressing) any transcripts
+            versions = (await db.execute(page(select(*HISTORY_VERSION_COLUMNS)))).all()
+            etag = history_etag(mode, rows=versions)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            uploads = (await db.execute(page(select(LectureUpload).options(undefer_group("content"))))).scalars().all()
+        etag = history_etag(mode, rows=uploads)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        has_more = len(uploads) > limit
+        uploads = uploads[:limit]
         
         history = []
         for upload in uploads:
-            history.append({
+            item = {
                 "id": upload.id,
                 "filename": upload.filename,
                 "file_size": upload.file_size,
                 "file_type": upload.file_type,
-                "transcript": upload.transcript,
-                "notes": upload.notes,
                 "created_at": upload.created_at.isoformat() if upload.created_at else None
-            })
+            }
+            if mode == "full":
+                item["transcript"] = upload.transcript
+                item["notes"] = upload.notes
+            history.append(item)
         
-        return JSONResponse(content={
+        next_cursor = None
+        if has_more and uploads:
+            next_cursor = encode_history_cursor(uploads[-1].created_at, uploads[-1].id)
+        
+        return FastJSONResponse(content={
             "status": "ok",
             "history": history,
-            "count": len(history)
-        })
+            "count": len(history),
+            "next_cursor": next_cursor
+        }, headers=cache_headers(etag))
     except Exception as e:
         print(f"Error retrieving history: {e}")
         return JSONResponse(content={
@@ -560,18 +1117,95 @@ async def get_history(db: Session = Depends(get_db), limit: int = 50) -> Dict[st
         }, status_code=500)
 
 
+@app.get("/history/export")
+async def export_history(format: str = "ndjson", since: Optional[datetime] = None, until: Optional[datetime] = None,
+                         filename: Optional[str] = None, transcripts: bool = True):
+    """
+    Streams every stored upload (oldest first) as NDJSON, one object per
+    line, or with `format=zip` as a ZIP of Markdown files. `since`/`until`
+    bound the upload time, `filename` matches a substring, and
+    `transcripts=false` exports only the notes. Rows are read through a
+    server-side cursor, so memory use doesn't grow with the history.
+    """
+    if format not in ("ndjson", "zip"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'zip'.")
+    query = export_query(since, until, filename, transcripts)
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+
+    async def export_stream():
+        # Own session: the request's dependencies are closed before a streamed body is sent
+        async with AsyncSessionLocal() as db:
+            if format == "zip":
+                async for chunk in zip_export(db, query):
+                    yield chunk
+            else:
+                async for line in ndjson_export(db, query):
+                    yield line
+
+    if format == "zip":
+        return StreamingResponse(export_stream(), media_type="application/zip", headers={
+            "Content-Disposition": f'attachment; filename="lecture-notes-{stamp}.zip"'
+        })
+    return StreamingResponse(export_stream(), media_type="application/x-ndjson", headers={
+        "Content-Disposition": f'attachment; filename="lecture-notes-{stamp}.ndjson"'
+    })
+
+
+MAX_SEARCH_LIMIT = 100
+
+@app.get("/search")
+async def search_history(q: str, db: AsyncSession = Depends(get_db), limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """
+    Full-text search over stored transcripts and notes, best match first.
+
+    Every word in `q` must match (end a word with `*` to match prefixes).
+    Hits include `<mark>`-highlighted snippets; page with `offset`.
+    """
+    if not search_enabled():
+        raise HTTPException(status_code=503, detail="Full-text search is not available on this server.")
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    offset = max(0, offset)
+
+    try:
+        hits, has_more = await search_uploads(db, q, limit, offset)
+        return FastJSONResponse(content={
+            "status": "ok",
+            "query": q,
+            "results": hits,
+            "count": len(hits),
+            "next_offset": offset + len(hits) if has_more else None
+        })
+    except Exception as e:
+        print(f"Error searching history: {e}")
+        return JSONResponse(content={
+            "status": "error",
+            "results": [],
+            "count": 0,
+            "error": str(e)
+        }, status_code=500)
+
+
 @app.get("/history/{upload_id}")
-async def get_upload_by_id(upload_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def get_upload_by_id(upload_id: int, request: Request, db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
     """
-    Retrieves a specific upload by ID.
+    Retrieves a specific upload by ID. The response carries an ETag; a
+    request with a matching If-None-Match gets an empty 304.
     """
     try:
-        upload = db.query(LectureUpload).filter(LectureUpload.id == upload_id).first()
-        
+        version = (await db.execute(
+            select(*HISTORY_VERSION_COLUMNS).where(LectureUpload.id == upload_id)
+        )).first()
+        if not version:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        etag = history_etag("upload", rows=[version])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        upload = await db.get(LectureUpload, upload_id, options=[undefer_group("content")])
         if not upload:
             raise HTTPException(status_code=404, detail="Upload not found")
         
-        return JSONResponse(content={
+        return FastJSONResponse(headers=cache_headers(etag), content={
             "status": "ok",
             "id": upload.id,
             "filename": upload.filename,
@@ -591,22 +1225,108 @@ async def get_upload_by_id(upload_id: int, db: Session = Depends(get_db)) -> Dic
         }, status_code=500)
 
 
+@app.get("/history/{upload_id}/transcript")
+async def get_transcript_range(upload_id: int, request: Request, db: AsyncSession = Depends(get_db),
+                               start: float = Query(0.0, alias="from", ge=0),
+                               end: Optional[float] = Query(None, alias="to", ge=0)) -> Dict[str, Any]:
+    """
+    Returns the words spoken between `from` and `to` seconds (to the end if
+    `to` is omitted) with their timings and confidences. The range is found
+    by binary search over the stored word timings; the full transcript is
+    not loaded.
+    """
+    if end is not None and end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'.")
+    try:
+        version = (await db.execute(
+            select(*HISTORY_VERSION_COLUMNS).where(LectureUpload.id == upload_id)
+        )).first()
+        if not version:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        etag = history_etag("transcript", start, end, rows=[version])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        blob = (await db.execute(
+            select(LectureUpload.word_timings).where(LectureUpload.id == upload_id)
+        )).scalar_one_or_none()
+        if not blob:
+            raise HTTPException(status_code=404, detail="No word timings are stored for this upload.")
+        timings = WordTimings(blob)
+        indexes = timings.index_range(start, end)
+        return FastJSONResponse(headers=cache_headers(etag), content={
+            "status": "ok",
+            "id": upload_id,
+            "from": start,
+            "to": end,
+            "duration": round(timings.duration, 3),
+            "total_words": timings.count,
+            "count": len(indexes),
+            "text": timings.text(indexes),
+            "words": timings.words(indexes),
+            "error": None
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error retrieving transcript range: {e}")
+        return JSONResponse(content={
+            "status": "error",
+            "error": str(e)
+        }, status_code=500)
+
+
+@app.post("/history/{upload_id}/regenerate-notes")
+async def regenerate_notes(upload_id: int, force: bool = False, db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    """
+    Re-summarizes a stored transcript with the current prompts and model and
+    saves the new notes, without re-transcribing the audio. Notes already
+    generated for this transcript, prompt and model are reused unless `force`.
+    """
+    try:
+        result = await regenerate_upload_notes(db, upload_id, force=force)
+        return JSONResponse(content={
+            "status": "ok",
+            **result,
+            "error": None
+        })
+    except HTTPException as e:
+        record_error("regenerate_notes", e.status_code)
+        raise e
+    except Exception as e:
+        await db.rollback()
+        status_code, error = describe_pipeline_error(e)
+        print(f"Error regenerating notes for upload {upload_id}: {error}")
+        record_error("regenerate_notes", status_code)
+        return JSONResponse(content={
+            "status": "error",
+            "id": upload_id,
+            "error": error
+        }, status_code=status_code)
+
+
 @app.delete("/history")
-async def clear_history(db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def clear_history(db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
     """
     Deletes all upload history. This MVP has no authentication or per-user
     segregation, so use this as a manual privacy control to clear stored
     notes/transcripts.
     """
     try:
-        deleted = db.query(LectureUpload).delete()
-        db.commit()
+        deleted = (await db.execute(delete(LectureUpload))).rowcount
+        # Finished jobs point at the deleted uploads and carry filenames
+        await db.execute(delete(LectureJob).where(LectureJob.status.in_([JOB_DONE, JOB_ERROR])))
+        # Cached notes are derived from the deleted transcripts
+        await db.execute(delete(NotesCacheEntry))
+        await db.commit()
+        # Unpersisted results are history too
+        result_cache.clear()
         return JSONResponse(content={
             "status": "ok",
             "deleted": deleted
         })
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error clearing history: {e}")
         return JSONResponse(content={
             "status": "error",
@@ -614,6 +1334,9 @@ async def clear_history(db: Session = Depends(get_db)) -> Dict[str, Any]:
         }, status_code=500)
 
 # --- Rate Limiting Note (as requested in the prompt) ---
-# For simple rate limiting, you could use a library like 'fastapi-limiter'
-# or implement a simple token bucket algorithm using a cache (like Redis).
-# For this MVP, we will only note it in the README.
+# Processing endpoints are rate limited per client IP with a token bucket and
+# capped on concurrent pipelines by AdmissionControlMiddleware
+# (backend/rate_limit.py); /process-lectures admits each file of a batch the
+# same way. Set RATE_LIMIT_STORE=sqlite to share the limits
+# across uvicorn workers on one host; a multi-host deployment would need a
+# shared store such as Redis behind the same interface.
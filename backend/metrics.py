@@ -0,0 +1,131 @@
+"""
+Prometheus metrics for the processing pipeline, served at `GET /metrics`.
+
+Each pipeline stage (saving the upload, cache lookup, transcoding, Deepgram,
+Gemini and the database commit) records a latency histogram and an in-flight gauge;
+failures are counted by error class. Recording is a few in-memory counter
+updates, so it is cheap enough for the hot path.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory so `/metrics` aggregates every worker.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# Upload saves and cache lookups take milliseconds; Deepgram and Gemini calls take minutes
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_DURATION = Histogram(
+    "lecture_stage_duration_seconds",
+    "Time spent in each pipeline stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_IN_FLIGHT = Gauge(
+    "lecture_stage_in_flight",
+    "Pipeline stages currently running.",
+    ["stage"],
+    multiprocess_mode="livesum",
+)
+ERRORS = Counter(
+    "lecture_errors_total",
+    "Failed requests by endpoint and error class.",
+    ["endpoint", "error_class"],
+)
+UPLOAD_BYTES = Counter(
+    "lecture_upload_bytes_total",
+    "Bytes of audio received.",
+)
+RESULTS = Counter(
+    "lecture_results_total",
+    "Processed lectures, by whether the result came from the cache.",
+    ["source"],
+)
+REJECTED = Counter(
+    "lecture_requests_rejected_total",
+    "Requests turned away by admission control.",
+    ["reason"],
+)
+UPSTREAM_RETRIES = Counter(
+    "lecture_upstream_retries_total",
+    "Upstream calls retried after a transient failure.",
+    ["upstream", "reason"],
+)
+TRANSCODES = Counter(
+    "lecture_transcodes_total",
+    "Uploads considered for transcoding, by outcome.",
+    ["outcome"],
+)
+TRANSCODE_BYTES = Counter(
+    "lecture_transcode_bytes_total",
+    "Bytes into and out of transcoding, for uploads that were transcoded.",
+    ["direction"],
+)
+TRANSCODE_BYTES_SAVED = Counter(
+    "lecture_transcode_bytes_saved_total",
+    "Bytes not uploaded to Deepgram thanks to transcoding.",
+)
+NOTES_REGENERATED = Counter(
+    "lecture_notes_regenerated_total",
+    "Notes regenerated from stored transcripts, by whether they came from the notes cache.",
+    ["source"],
+)
+CIRCUIT_OPEN = Gauge(
+    "lecture_circuit_open",
+    "1 while an upstream's circuit breaker is open.",
+    ["upstream"],
+    multiprocess_mode="max",
+)
+
+# The error classes behind the pipeline's HTTPException status codes
+ERROR_CLASSES = {
+    400: "invalid_input",
+    401: "upstream_auth",
+    404: "not_found",
+    410: "gone",
+    429: "rate_limited",
+    503: "upstream_unavailable",
+    504: "upstream_timeout",
+}
+
+
+def error_class(status_code: int) -> str:
+    return ERROR_CLASSES.get(status_code, "client_error" if 400 <= status_code < 500 else "internal")
+
+
+def record_error(endpoint: str, status_code: int):
+    ERRORS.labels(endpoint, error_class(status_code)).inc()
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Times the enclosed block as `stage` and counts it as in flight meanwhile."""
+    in_flight = STAGE_IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+def render_metrics():
+    """Returns (body, content type) in the Prometheus text format."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,424 @@
+"""
+Transcription and summarization pipeline shared by the HTTP endpoints and
+the background job worker.
+"""
+import os
+import io
+import mmap
+import asyncio
+import httpx
+from contextlib import contextmanager, nullcontext
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+from backend.cache import notes_cache_key
+from backend.result_writer import result_writer, lecture_row
+from backend.http_client import get_http_client
+from backend.metrics import track_stage
+from backend.resilience import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    CircuitBreaker,
+    CircuitOpenError,
+    UploadModeCache,
+    call_with_retries,
+)
+from backend import segmenter, transcoder
+from backend.timings import pack_result_word_timings
+from backend.uploads import MAX_RESUMABLE_UPLOAD_MB
+from backend.summarizer import GEMINI_API_KEY, get_gemini_client, is_gemini_api_error, summarize_transcript
+
+# --- Configuration and Setup ---
+
+# Load environment variables from .env file
+load_dotenv()
+DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
+# Deepgram is called over its REST API with the shared httpx client (see
+# request_transcription), so no SDK is imported or constructed at startup.
+if not DEEPGRAM_API_KEY:
+    print("Warning: DEEPGRAM_API_KEY not set")
+
+
+# Define constants
+# Note: Vercel has a 4.5MB limit; default to 4MB unless overridden
+MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "4"))
+MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+# Larger files are accepted when they can be split into segments with ffmpeg
+# (only useful on hosts without a request body limit, i.e. not Vercel)
+MAX_SEGMENTED_FILE_SIZE_MB = int(os.getenv("MAX_SEGMENTED_FILE_SIZE_MB", "500"))
+# Overridable so benchmarks and tests can point at a local stub server
+DEEPGRAM_API_URL = os.getenv("DEEPGRAM_API_URL", "https://api.deepgram.com").rstrip("/")
+DEEPGRAM_LISTEN_URL = f"{DEEPGRAM_API_URL}/v1/listen"
+DEEPGRAM_LISTEN_PARAMS = {
+    "model": "nova-2",
+    "smart_format": "true",
+}
+# How audio is sent to Deepgram: "multipart" sends a multipart/form-data body
+# first, "stream" sends the raw audio as a chunked request body first. Either
+# way the file is read in chunks, never buffered whole, and the other format
+# is tried if Deepgram reports the audio as corrupt or unsupported (and then
+# sent first for that MIME type from then on).
+DEEPGRAM_UPLOAD_MODE = os.getenv("DEEPGRAM_UPLOAD_MODE", "multipart").lower()
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Fails Deepgram calls fast while the API is down (shared by every request in the process)
+deepgram_breaker = CircuitBreaker("deepgram", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+# Upload format that worked for MIME types whose default format was rejected
+deepgram_upload_modes = UploadModeCache()
+
+# --- Helper Functions ---
+
+def get_mime_type_from_filename(filename: str) -> str:
+    """Determine MIME type from file extension."""
+    if not filename:
+        return "audio/mpeg"
+
+    ext = filename.lower().split('.')[-1]
+    mime_map = {
+        'mp3': 'audio/mpeg',
+        'wav': 'audio/wav',
+        'm4a': 'audio/m4a',
+        'ogg': 'audio/ogg',
+        'flac': 'audio/flac',
+        'mp4': 'video/mp4',
+        'wma': 'audio/x-ms-wma',
+        'aac': 'audio/aac',
+    }
+    return mime_map.get(ext, 'audio/mpeg')
+
+def get_max_upload_size_mb() -> int:
+    """Returns the largest accepted upload in MB (higher when long audio can be segmented)."""
+    if segmenter.ffmpeg_available():
+        return max(MAX_FILE_SIZE_MB, MAX_SEGMENTED_FILE_SIZE_MB)
+    return MAX_FILE_SIZE_MB
+
+def get_max_resumable_upload_size_mb() -> int:
+    """
+    Returns the largest resumable upload in MB. Chunks get past the request
+    body cap (MAX_FILE_SIZE_MB), and without ffmpeg the assembled file is sent
+    to Deepgram in one request, so only MAX_RESUMABLE_UPLOAD_MB applies, plus
+    MAX_SEGMENTED_FILE_SIZE_MB when the audio will be segmented.
+    """
+    if segmenter.ffmpeg_available():
+        return min(MAX_RESUMABLE_UPLOAD_MB, MAX_SEGMENTED_FILE_SIZE_MB)
+    return MAX_RESUMABLE_UPLOAD_MB
+
+def ensure_api_keys():
+    """Raises an HTTPException if either upstream client is not configured."""
+    if not DEEPGRAM_API_KEY:
+        raise HTTPException(
+            status_code=500,
+            detail="Server configuration error: DEEPGRAM_API_KEY is not set."
+        )
+    ensure_gemini_key()
+
+def ensure_gemini_key():
+    """Raises an HTTPException if the Gemini client is not configured."""
+    if not GEMINI_API_KEY or not get_gemini_client():
+        raise HTTPException(
+            status_code=500,
+            detail="Server configuration error: GEMINI_API_KEY is not set or client failed to initialize."
+        )
+
+def describe_pipeline_error(e: Exception) -> Tuple[int, str]:
+    """
+    Maps an unexpected pipeline exception to a status code and a
+    user-friendly error message.
+    """
+    if isinstance(e, asyncio.TimeoutError):
+        return 504, "Transcription timeout: The Deepgram API took too long to respond. Please check your internet connection and try again with a smaller file."
+    if is_gemini_api_error(e):
+        return 500, f"Gemini API Error: {str(e)}"
+
+    error_type = type(e).__name__
+    error_msg = str(e)
+    # Provide more helpful error messages for common issues
+    if "timeout" in error_msg.lower() or "handshake" in error_msg.lower() or "ConnectTimeout" in error_type:
+        user_friendly_error = "Connection timeout: Unable to connect to Deepgram API. Please check your internet connection and ensure your API key is valid."
+    elif "SSL" in error_msg or "certificate" in error_msg.lower():
+        user_friendly_error = "SSL connection error: There was a problem establishing a secure connection. Please check your network settings."
+    elif "401" in error_msg or "unauthorized" in error_msg.lower():
+        user_friendly_error = "Authentication error: Invalid Deepgram API key. Please check your .env file."
+    else:
+        user_friendly_error = f"Processing failed: {error_type}: {error_msg}"
+    return 500, user_friendly_error
+
+def _file_length(audio_file) -> int:
+    position = audio_file.tell()
+    length = audio_file.seek(0, os.SEEK_END)
+    audio_file.seek(position)
+    return length
+
+async def _iter_file_chunks(audio_file):
+    """Yields a file (or memory map) from the start in fixed-size chunks."""
+    audio_file.seek(0)
+    while chunk := await asyncio.to_thread(audio_file.read, UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+@contextmanager
+def _map_for_replay(audio_file):
+    """
+    Memory-maps a file so a second upload attempt reads it from the page
+    cache instead of a second in-memory copy. Falls back to the file itself
+    when it can't be mapped (e.g. a small upload still held in memory).
+    """
+    try:
+        mapped = mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        audio_file.seek(0)
+        yield audio_file
+        return
+    with mapped:
+        yield mapped
+
+def _is_format_error(response: httpx.Response) -> bool:
+    """True if Deepgram rejected the body as corrupt or unsupported audio."""
+    error_data = response.json() if response.headers.get('content-type', '').startswith('application/json') else {}
+    return "corrupt" in str(error_data).lower() or "unsupported" in str(error_data).lower()
+
+# --- Pipeline Stages ---
+
+async def request_transcription(file_path: Optional[str], filename: str, content_type: str, file_size: int,
+                                audio_file: Optional[BinaryIO] = None) -> Dict[str, Any]:
+    """
+    Sends the audio file at `file_path` (or the already open binary
+    `audio_file`) to the Deepgram REST API in a single request and returns
+    the raw JSON response.
+    """
+    # Transcription using Deepgram REST API directly
+    # Using REST API instead of SDK for better timeout control
+    print(f"Starting transcription for file: {filename} ({file_size / 1024 / 1024:.2f} MB)")
+
+    # Calculate timeout based on file size (roughly 1 minute per 10 minutes of audio + buffer)
+    # Minimum 60 seconds, maximum 15 minutes
+    estimated_timeout = max(60, min(900, int(file_size / (1024 * 1024)) * 30))
+
+    try:
+        # Use Deepgram REST API directly over the shared, pooled HTTP client
+        async def call_deepgram_rest_api(audio_file: BinaryIO):
+            client = get_http_client()
+            headers = {
+                "Authorization": f"Token {DEEPGRAM_API_KEY}",
+            }
+            timeout = httpx.Timeout(estimated_timeout, connect=30.0)
+
+            # Determine MIME type from content_type or filename
+            mime_type = content_type or get_mime_type_from_filename(filename)
+            print(f"Detected MIME type: {mime_type} for file: {filename}")
+
+            # Verify file is not empty
+            if _file_length(audio_file) == 0:
+                raise ValueError("Uploaded file is empty")
+
+            async def post_multipart(body_file):
+                # httpx reads file objects in chunks while sending the form
+                files = {
+                    "audio": (filename or "audio.mp3", body_file, mime_type)
+                }
+                response = await client.post(
+                    DEEPGRAM_LISTEN_URL,
+                    headers=headers,
+                    files=files,
+                    params=DEEPGRAM_LISTEN_PARAMS,
+                    timeout=timeout
+                )
+                response.raise_for_status()
+                return response.json()
+
+            async def post_raw(body_file):
+                # Send raw bytes with Content-Type header as a chunked request body
+                headers_with_content = headers.copy()
+                headers_with_content["Content-Type"] = mime_type
+                response = await client.post(
+                    DEEPGRAM_LISTEN_URL,
+                    headers=headers_with_content,
+                    content=_iter_file_chunks(body_file),
+                    params=DEEPGRAM_LISTEN_PARAMS,
+                    timeout=timeout
+                )
+                response.raise_for_status()
+                return response.json()
+
+            posts = {"multipart": post_multipart, "raw": post_raw}
+            default_mode = "raw" if DEEPGRAM_UPLOAD_MODE == "stream" else "multipart"
+            first_mode = deepgram_upload_modes.get(mime_type, default_mode)
+            other_mode = "multipart" if first_mode == "raw" else "raw"
+
+            def send(mode, body_file):
+                # Each attempt rewinds the body: httpx seeks file fields, and the raw iterator starts at 0
+                return call_with_retries(deepgram_breaker, lambda: posts[mode](body_file))
+
+            try:
+                if first_mode == "raw":
+                    print(f"Streaming to Deepgram API as a chunked request body (timeout: {estimated_timeout}s)...")
+                else:
+                    print(f"Uploading to Deepgram API as multipart/form-data (timeout: {estimated_timeout}s)...")
+                audio_file.seek(0)
+                return await send(first_mode, audio_file)
+            except httpx.HTTPStatusError as e:
+                # If the first format fails with "corrupt or unsupported", replay in the other one
+                if e.response.status_code == 400 and _is_format_error(e.response):
+                    print(f"{first_mode.capitalize()} upload failed, trying {other_mode} upload...")
+                    with _map_for_replay(audio_file) as replay_file:
+                        result = await send(other_mode, replay_file)
+                    # Later uploads of this type skip the format that was rejected
+                    deepgram_upload_modes.remember(mime_type, other_mode, default_mode)
+                    return result
+                raise
+
+        with nullcontext(audio_file) if audio_file is not None else open(file_path, "rb") as source_file:
+            result = await asyncio.wait_for(
+                call_deepgram_rest_api(source_file),
+                timeout=estimated_timeout + 60  # Add buffer for processing
+            )
+
+        print("Deepgram API call completed successfully")
+
+        # Check the response has a transcript to extract
+        if "results" not in result or "channels" not in result["results"]:
+            raise HTTPException(
+                status_code=500,
+                detail="Unexpected response format from Deepgram API"
+            )
+
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Deepgram API is currently unavailable after repeated failures. Please try again in {e.retry_after:.0f} seconds.",
+            headers={"Retry-After": str(int(e.retry_after + 0.999))},
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Transcription timeout: The Deepgram API took longer than {estimated_timeout // 60} minutes to respond. This might be due to a very large file. Please try with a smaller file or split the audio into segments."
+        )
+    except httpx.ConnectTimeout as e:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Connection timeout: Unable to connect to Deepgram API within 30 seconds. Please check your internet connection, firewall settings, and ensure api.deepgram.com is accessible."
+        )
+    except httpx.TimeoutException as e:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Transcription timeout: The Deepgram API took longer than {estimated_timeout // 60} minutes to respond. This might be due to a very large file. Please try with a smaller file or split the audio into segments."
+        )
+    except httpx.TransportError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Connection error: Unable to reach Deepgram API. Please check your internet connection and ensure api.deepgram.com is accessible. Error: {str(e)}"
+        )
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 401:
+            raise HTTPException(
+                status_code=401,
+                detail="Authentication error: Invalid Deepgram API key. Please check your .env file."
+            )
+        elif e.response.status_code == 400:
+            # Try to parse error message
+            try:
+                error_data = e.response.json()
+                error_msg = error_data.get("err_msg", e.response.text)
+                if "corrupt" in error_msg.lower() or "unsupported" in error_msg.lower():
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Audio file error: {error_msg}. Please ensure the file is a valid, uncorrupted audio file. Supported formats: MP3, WAV, M4A, OGG, FLAC, MP4 (with audio). Try converting the file to MP3 format."
+                    )
+            except:
+                pass
+            raise HTTPException(
+                status_code=400,
+                detail=f"Deepgram API error: {e.response.text}. Please check that your audio file is valid and in a supported format (MP3, WAV, M4A, OGG, FLAC, or MP4 with audio)."
+            )
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"Deepgram API error: {e.response.text}"
+        )
+    except Exception as e:
+        error_msg = str(e)
+        error_type = type(e).__name__
+        print(f"Deepgram API error: {error_type}: {error_msg}")
+
+        if "timeout" in error_msg.lower():
+            raise HTTPException(
+                status_code=504,
+                detail=f"Transcription timeout: {error_msg}. Try with a smaller file or check your internet connection."
+            )
+        elif "connection" in error_msg.lower() or "connect" in error_msg.lower():
+            raise HTTPException(
+                status_code=503,
+                detail=f"Connection error: Unable to connect to Deepgram API. Please check your internet connection and firewall settings. Error: {error_msg}"
+            )
+        raise
+
+    return result
+
+async def transcribe_audio_result(file_path: Optional[str], filename: str, content_type: str, file_size: int,
+                                  audio_file: Optional[BinaryIO] = None) -> Dict[str, Any]:
+    """
+    Transcribes an audio file and returns the Deepgram response. Long
+    recordings on disk are split at silences and transcribed as concurrent
+    segments (see backend/segmenter.py); the stitched result has the same shape.
+    Other files on disk may be transcoded to compact mono audio before
+    uploading (see backend/transcoder.py).
+    """
+    try:
+        segment, duration = await segmenter.should_segment(file_path, file_size, MAX_FILE_SIZE_BYTES)
+        if segment:
+            return await segmenter.transcribe_segmented(file_path, filename, duration, request_transcription)
+    except segmenter.SegmentationError as e:
+        print(f"Segmentation failed, falling back to a single request: {e}")
+        if file_size > MAX_FILE_SIZE_BYTES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Could not split the audio into segments ({e}). Files over {MAX_FILE_SIZE_MB}MB must be a format ffmpeg can read."
+            )
+    async with transcoder.prepared_audio(file_path, filename, content_type, file_size) as (path, mime_type, size):
+        if path != file_path:
+            # Upload the transcode rather than the already open original
+            audio_file = None
+        return await request_transcription(path, filename, mime_type, size, audio_file=audio_file)
+
+def extract_transcript(result: Dict[str, Any]) -> str:
+    """Returns the transcript text from a Deepgram response."""
+    return result["results"]["channels"][0]["alternatives"][0]["transcript"]
+
+async def transcribe_audio(file_path: Optional[str], filename: str, content_type: str, file_size: int,
+                           audio_file: Optional[BinaryIO] = None) -> Tuple[str, Optional[bytes]]:
+    """
+    Transcribes the audio file at `file_path` (or the already open binary
+    `audio_file`) and returns the transcript text and its word timings
+    packed by backend/timings.py (None if Deepgram returned no words).
+    """
+    with track_stage("transcription"):
+        result = await transcribe_audio_result(file_path, filename, content_type, file_size, audio_file=audio_file)
+    transcript = extract_transcript(result)
+
+    if not transcript:
+        raise HTTPException(
+            status_code=400,
+            detail="Transcription failed or returned empty text. The audio file might be silent or corrupted."
+        )
+
+    # Packing tens of thousands of words takes a moment; keep it off the event loop
+    return transcript, await asyncio.to_thread(pack_result_word_timings, result)
+
+async def save_lecture_result(filename: str, file_size: int, file_type: str, transcript: str, notes: str,
+                              content_hash: Optional[str] = None, word_timings: Optional[bytes] = None,
+                              notes_generated: bool = False) -> Optional[int]:
+    """
+    Saves a processed lecture to the database and returns its ID, or None if
+    the save failed (processing results are still returned to the caller).
+    Rows are group-committed with other results finishing at the same time.
+    Pass `notes_generated` when the notes were just produced by Gemini with
+    the current prompts, so they also seed the notes cache.
+    """
+    notes_key = notes_cache_key(transcript) if notes_generated else None
+    with track_stage("db_commit"):
+        upload_id = await result_writer.save(
+            lecture_row(filename, file_size, file_type, transcript, notes, content_hash, word_timings, notes_key)
+        )
+    if upload_id is not None:
+        print(f"Saved upload to database with ID: {upload_id}")
+    return upload_id
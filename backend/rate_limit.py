@@ -0,0 +1,318 @@
+"""
+Admission control for the processing endpoints.
+
+Two checks run before a pipeline request reaches its endpoint:
+
+- a token bucket per client IP (RATE_LIMIT_PER_MINUTE, bursts of up to
+  RATE_LIMIT_BURST), and
+- a global cap on pipelines running at once (MAX_CONCURRENT_PIPELINES).
+
+`/process-lectures` is admitted file by file instead: each file of a batch
+takes its own token and slot (`admit_pipeline`) when it starts, waiting for
+them (the batch was already accepted) until BATCH_ADMISSION_TIMEOUT_SECONDS
+after the request arrived. Only a file that can't be admitted by then gets
+a 429 result line.
+
+Requests that fail either check get a 429 with `Retry-After` right away
+rather than queueing, so latency for admitted requests stays predictable
+under overload. Limiter state lives in a pluggable store: "memory" (one
+process) or "sqlite" (a small database file shared by every uvicorn worker
+on the host).
+"""
+import os
+import math
+import time
+import uuid
+import sqlite3
+import asyncio
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from backend.metrics import REJECTED
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Sustained pipeline requests allowed per client IP, and how many may arrive at once
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "10"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "5"))
+# Pipelines allowed to run at once (across all workers with the sqlite store)
+MAX_CONCURRENT_PIPELINES = int(os.getenv("MAX_CONCURRENT_PIPELINES", "8"))
+# Retry-After sent when the concurrency cap is reached
+PIPELINE_BUSY_RETRY_AFTER = int(os.getenv("PIPELINE_BUSY_RETRY_AFTER", "10"))
+# Longest a /process-lectures batch waits for tokens and slots for its files
+# (50 files at the default 10 per minute need about 5 minutes)
+BATCH_ADMISSION_TIMEOUT_SECONDS = float(os.getenv("BATCH_ADMISSION_TIMEOUT_SECONDS", "900"))
+# How often a waiting batch file checks for a free pipeline slot
+PIPELINE_SLOT_POLL_SECONDS = float(os.getenv("PIPELINE_SLOT_POLL_SECONDS", "1"))
+# A slot held longer than this (e.g. by a crashed worker) is reclaimed
+PIPELINE_SLOT_LEASE_SECONDS = float(os.getenv("PIPELINE_SLOT_LEASE_SECONDS", "3600"))
+# "memory" or "sqlite"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", os.path.join(tempfile.gettempdir(), "lecture_rate_limits.db"))
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() in ("1", "true", "yes")
+
+# Endpoints that run one pipeline in the request (rate limited and capped),
+# plus /uploads/{upload_id}/finalize. /process-lectures admits each file itself.
+PIPELINE_PATHS = {"/process-lecture", "/process-lecture/stream"}
+# Endpoints that only queue work or start an upload (rate limited)
+RATE_LIMITED_PATHS = PIPELINE_PATHS | {"/jobs", "/uploads"}
+
+
+def is_pipeline_path(path: str) -> bool:
+    return path in PIPELINE_PATHS or (path.startswith("/uploads/") and path.endswith("/finalize"))
+
+
+def is_rate_limited_path(path: str) -> bool:
+    # Regenerating notes costs a Gemini call
+    return (path in RATE_LIMITED_PATHS or is_pipeline_path(path)
+            or (path.startswith("/history/") and path.endswith("/regenerate-notes")))
+
+
+def refill_bucket(tokens: float, updated: float, now: float, rate: float, burst: float) -> Tuple[float, float]:
+    """
+    Refills a bucket last seen at `updated` and takes one token. Returns the
+    new token count and, if no token was available, the seconds until one is
+    (0.0 when the request is allowed).
+    """
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate if rate > 0 else float("inf")
+
+
+class MemoryRateLimitStore:
+    """Limiter state for a single process."""
+
+    # Idle buckets are dropped once there are this many
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._slots: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, wait = refill_bucket(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_BUCKETS:
+                full_after = burst / rate if rate > 0 else float("inf")
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < full_after}
+            return wait
+
+    def acquire_slot(self, limit: int, lease_seconds: float) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            self._slots = {k: v for k, v in self._slots.items() if v > now}
+            if len(self._slots) >= limit:
+                return None
+            slot = uuid.uuid4().hex
+            self._slots[slot] = now + lease_seconds
+            return slot
+
+    def release_slot(self, slot: str):
+        with self._lock:
+            self._slots.pop(slot, None)
+
+
+class SQLiteRateLimitStore:
+    """Limiter state in a SQLite file, shared by every process that opens it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pipeline_slots (slot TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; statements run in autocommit with explicit BEGIN IMMEDIATE
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        # Wall-clock time: monotonic clocks aren't comparable across processes
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, wait = refill_bucket(tokens, updated, now, rate, burst)
+            conn.execute(
+                "INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            if not row and rate > 0:
+                # New client: drop buckets that have been full for a while
+                conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - burst / rate,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire_slot(self, limit: int, lease_seconds: float) -> Optional[str]:
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM pipeline_slots WHERE expires_at < ?", (now,))
+            (in_use,) = conn.execute("SELECT COUNT(*) FROM pipeline_slots").fetchone()
+            slot = None
+            if in_use < limit:
+                slot = uuid.uuid4().hex
+                conn.execute("INSERT INTO pipeline_slots (slot, expires_at) VALUES (?, ?)", (slot, now + lease_seconds))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return slot
+
+    def release_slot(self, slot: str):
+        self._connect().execute("DELETE FROM pipeline_slots WHERE slot = ?", (slot,))
+
+
+def create_store():
+    if RATE_LIMIT_STORE == "sqlite":
+        return SQLiteRateLimitStore(RATE_LIMIT_DB_PATH)
+    if RATE_LIMIT_STORE != "memory":
+        print(f"Warning: Unknown RATE_LIMIT_STORE '{RATE_LIMIT_STORE}'; using memory")
+    return MemoryRateLimitStore()
+
+
+_store = None
+
+
+def get_store():
+    """The process-wide limiter store, shared by the middleware and batch admission."""
+    global _store
+    if _store is None:
+        _store = create_store()
+    return _store
+
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+RATE_LIMITED_MESSAGE = "Too many uploads from this address. Please wait and try again."
+PIPELINE_BUSY_MESSAGE = "The server is busy processing other lectures. Please try again shortly."
+
+
+def retry_after_header(retry_after: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+def too_many_requests(message: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        content={"status": "error", "error": message},
+        status_code=429,
+        headers=retry_after_header(retry_after),
+    )
+
+
+def batch_admission_deadline() -> float:
+    """The time.monotonic() by which every file of a batch arriving now must be admitted."""
+    return time.monotonic() + BATCH_ADMISSION_TIMEOUT_SECONDS
+
+
+async def admit_pipeline(client: str, deadline: float, store=None) -> Optional[str]:
+    """
+    Admits one pipeline run for `client` outside the middleware (each file of
+    a /process-lectures batch): waits for a token and then a pipeline slot,
+    and returns the slot for `release_pipeline`. Raises a 429 HTTPException
+    with Retry-After if either can't be had before `deadline` (a
+    time.monotonic() value). Returns None when rate limiting is disabled.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+    store = store or get_store()
+    while True:
+        wait = await asyncio.to_thread(store.take_token, client, RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST)
+        if wait <= 0:
+            break
+        if time.monotonic() + wait > deadline:
+            REJECTED.labels("rate_limit").inc()
+            raise HTTPException(status_code=429, detail=RATE_LIMITED_MESSAGE, headers=retry_after_header(wait))
+        # Another file of the batch may take the token first; then wait again
+        await asyncio.sleep(wait)
+    while True:
+        slot = await asyncio.to_thread(store.acquire_slot, MAX_CONCURRENT_PIPELINES, PIPELINE_SLOT_LEASE_SECONDS)
+        if slot is not None:
+            return slot
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            REJECTED.labels("concurrency").inc()
+            raise HTTPException(status_code=429, detail=PIPELINE_BUSY_MESSAGE,
+                                headers=retry_after_header(PIPELINE_BUSY_RETRY_AFTER))
+        await asyncio.sleep(min(PIPELINE_SLOT_POLL_SECONDS, remaining))
+
+
+async def release_pipeline(slot: Optional[str], store=None):
+    if slot is not None:
+        await asyncio.to_thread((store or get_store()).release_slot, slot)
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware applying the per-IP token bucket and the pipeline
+    concurrency cap. Slots are held until the response (including a streamed
+    one) has finished.
+    """
+
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store or get_store()
+
+    async def __call__(self, scope, receive, send):
+        if (not RATE_LIMIT_ENABLED or scope["type"] != "http" or scope["method"] != "POST"
+                or not is_rate_limited_path(scope["path"])):
+            await self.app(scope, receive, send)
+            return
+
+        wait = await asyncio.to_thread(
+            self.store.take_token, client_ip(scope), RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST
+        )
+        if wait > 0:
+            REJECTED.labels("rate_limit").inc()
+            response = too_many_requests(RATE_LIMITED_MESSAGE, wait)
+            await response(scope, receive, send)
+            return
+
+        if not is_pipeline_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        slot = await asyncio.to_thread(self.store.acquire_slot, MAX_CONCURRENT_PIPELINES, PIPELINE_SLOT_LEASE_SECONDS)
+        if slot is None:
+            REJECTED.labels("concurrency").inc()
+            response = too_many_requests(PIPELINE_BUSY_MESSAGE, PIPELINE_BUSY_RETRY_AFTER)
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await asyncio.to_thread(self.store.release_slot, slot)
@@ -0,0 +1,193 @@
+"""
+Regenerating notes from stored transcripts.
+
+Changing the notes prompts (backend/summarizer.py) or GEMINI_MODEL doesn't
+require re-uploading and re-transcribing: `POST /history/{id}/regenerate-notes`
+re-summarizes one stored transcript, and this module's CLI does it in bulk:
+
+    python -m backend.regenerate --concurrency 4
+    python -m backend.regenerate --ids 12 15 --dry-run
+
+Generated notes are cached in the `notes_cache` table under (transcript
+hash, prompt hash, model), seeded by every pipeline run (backend/cache.py),
+so regenerating with a prompt and model that were already used costs no
+Gemini call.
+"""
+import os
+import sys
+import asyncio
+import argparse
+import traceback
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
+
+from backend.cache import NotesKey, notes_cache_key, lookup_cached_notes, store_cached_notes
+from backend.database import init_db, AsyncSessionLocal, close_async_db, LectureUpload
+from backend.metrics import NOTES_REGENERATED
+from backend.pipeline import describe_pipeline_error, ensure_gemini_key
+from backend.summarizer import GEMINI_MODEL, notes_prompt_hash, summarize_transcript
+
+# Uploads re-summarized at once by the bulk CLI (Gemini calls are also
+# capped process-wide by GEMINI_MAX_CONCURRENCY)
+REGENERATE_CONCURRENCY = int(os.getenv("REGENERATE_CONCURRENCY", "4"))
+
+# Generations in flight, so concurrent requests for the same key share one Gemini call
+_in_flight: Dict[NotesKey, "asyncio.Future[str]"] = {}
+
+
+async def _generate_notes(key: NotesKey, transcript: str) -> str:
+    notes = await summarize_transcript(transcript)
+    await store_cached_notes(key, notes)
+    return notes
+
+
+async def notes_for_transcript(transcript: str, force: bool = False) -> Tuple[str, bool]:
+    """
+    Returns (notes, cached) for `transcript` with the current prompts and
+    model, generating them with Gemini only on a cache miss (or when `force`).
+    """
+    key = notes_cache_key(transcript)
+    if not force:
+        async with AsyncSessionLocal() as db:
+            notes = await lookup_cached_notes(db, key)
+        if notes is not None:
+            NOTES_REGENERATED.labels("cache").inc()
+            return notes, True
+
+    ensure_gemini_key()
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_generate_notes(key, transcript))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shielded: one caller going away must not cancel the others' generation
+    notes = await asyncio.shield(task)
+    NOTES_REGENERATED.labels("gemini").inc()
+    return notes, False
+
+
+async def regenerate_upload_notes(db: AsyncSession, upload_id: int, force: bool = False) -> Dict[str, Any]:
+    """
+    Re-summarizes a stored upload's transcript and saves the new notes on
+    it. Returns {"id", "notes", "cached", "changed"}; raises a 404 if the
+    upload doesn't exist.
+    """
+    upload = await db.get(LectureUpload, upload_id, options=[undefer_group("content")])
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    # End the read transaction: a WAL snapshot held across the Gemini call
+    # couldn't be upgraded to write once another connection has committed
+    await db.commit()
+
+    notes, cached = await notes_for_transcript(upload.transcript, force=force)
+    changed = notes != upload.notes
+    if changed:
+        # The update trigger keeps the search index in step
+        upload.notes = notes
+        await db.commit()
+    return {"id": upload.id, "notes": notes, "cached": cached, "changed": changed}
+
+
+async def _upload_ids(ids: Optional[List[int]], since: Optional[datetime], limit: Optional[int]) -> List[int]:
+    query = select(LectureUpload.id).order_by(LectureUpload.id)
+    if ids:
+        query = query.where(LectureUpload.id.in_(ids))
+    if since:
+        query = query.where(LectureUpload.created_at >= since)
+    if limit:
+        query = query.limit(limit)
+    async with AsyncSessionLocal() as db:
+        return list((await db.execute(query)).scalars())
+
+
+async def _is_cached(upload_id: int) -> bool:
+    async with AsyncSessionLocal() as db:
+        transcript = (await db.execute(
+            select(LectureUpload.transcript).where(LectureUpload.id == upload_id)
+        )).scalar_one()
+        return await lookup_cached_notes(db, notes_cache_key(transcript)) is not None
+
+
+async def regenerate_all(upload_ids: List[int], concurrency: int, force: bool = False,
+                         dry_run: bool = False) -> Dict[str, int]:
+    """
+    Regenerates the notes of `upload_ids`, at most `concurrency` at a time,
+    each in its own session so only in-flight transcripts are held in memory.
+    With `dry_run`, only reports which uploads would need a Gemini call.
+    Returns counts by outcome.
+    """
+    counts = {"changed": 0, "unchanged": 0, "cached": 0, "gemini": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def regenerate_one(upload_id: int):
+        async with semaphore:
+            try:
+                if dry_run:
+                    cached = not force and await _is_cached(upload_id)
+                    counts["cached" if cached else "gemini"] += 1
+                    print(f"Upload {upload_id}: {'cached' if cached else 'needs a Gemini call'}")
+                    return
+                async with AsyncSessionLocal() as db:
+                    result = await regenerate_upload_notes(db, upload_id, force=force)
+            except Exception as e:
+                if isinstance(e, HTTPException):
+                    error = e.detail
+                else:
+                    print(traceback.format_exc())
+                    error = describe_pipeline_error(e)[1]
+                counts["failed"] += 1
+                print(f"Upload {upload_id} failed: {error}")
+                return
+            counts["cached" if result["cached"] else "gemini"] += 1
+            counts["changed" if result["changed"] else "unchanged"] += 1
+            print(f"Upload {upload_id}: {'updated' if result['changed'] else 'unchanged'}"
+                  f"{' (from cache)' if result['cached'] else ''}")
+
+    await asyncio.gather(*(regenerate_one(upload_id) for upload_id in upload_ids))
+    return counts
+
+
+async def run_regenerate(args: argparse.Namespace) -> bool:
+    init_db()
+    try:
+        upload_ids = await _upload_ids(args.ids, args.since, args.limit)
+        print(f"Regenerating notes for {len(upload_ids)} uploads with {GEMINI_MODEL} "
+              f"(prompt {notes_prompt_hash()[:12]}, concurrency {args.concurrency})")
+        counts = await regenerate_all(upload_ids, args.concurrency, force=args.force, dry_run=args.dry_run)
+    finally:
+        await close_async_db()
+    if args.dry_run:
+        print(f"Dry run: {counts['cached']} cached, {counts['gemini']} would call Gemini, {counts['failed']} failed")
+    else:
+        print(f"Done: {counts['changed']} updated, {counts['unchanged']} unchanged, "
+              f"{counts['cached']} from the notes cache, {counts['gemini']} Gemini calls, {counts['failed']} failed")
+    return counts["failed"] == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate notes for stored uploads from their transcripts.")
+    parser.add_argument("--ids", type=int, nargs="+", help="Upload IDs to regenerate (default: all)")
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="Only uploads created at or after this ISO date/time")
+    parser.add_argument("--limit", type=int, help="Regenerate at most this many uploads (oldest first)")
+    parser.add_argument("--concurrency", type=int, default=REGENERATE_CONCURRENCY,
+                        help=f"Uploads regenerated in parallel (default: {REGENERATE_CONCURRENCY})")
+    parser.add_argument("--force", action="store_true", help="Ignore the notes cache and call Gemini again")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report which uploads would need a Gemini call")
+    args = parser.parse_args()
+
+    try:
+        ok = asyncio.run(run_regenerate(args))
+    except KeyboardInterrupt:
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
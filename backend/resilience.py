@@ -0,0 +1,207 @@
+"""
+Retries and circuit breaking for upstream API calls.
+
+Transient failures (429, 5xx, dropped connections) are retried with jittered
+exponential backoff, waiting at least as long as the upstream's `Retry-After`
+asks. A circuit breaker counts consecutive transient failures; once
+CIRCUIT_FAILURE_THRESHOLD is reached it opens and calls fail immediately for
+CIRCUIT_RESET_SECONDS, after which a single trial call decides whether it
+closes again. Breaker state is per process.
+"""
+import os
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from backend.metrics import CIRCUIT_OPEN, UPSTREAM_RETRIES
+
+# Retries after the first attempt (0 disables retrying)
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+# Backoff before retry n is a random delay in [0, base * 2**n], capped at the max
+UPSTREAM_RETRY_BASE_SECONDS = float(os.getenv("UPSTREAM_RETRY_BASE_SECONDS", "0.5"))
+UPSTREAM_RETRY_MAX_SECONDS = float(os.getenv("UPSTREAM_RETRY_MAX_SECONDS", "30"))
+# Consecutive transient failures that open the circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Status codes worth another attempt
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Connection failures worth another attempt. Read/write timeouts are not
+# retried: the call already used its whole (size-based) timeout.
+RETRYABLE_TRANSPORT_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.ReadError,
+    httpx.WriteError,
+    httpx.RemoteProtocolError,
+)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open; retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        """Raises CircuitOpenError unless a call may go ahead."""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        retry_after = max(1.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print(f"{self.name} circuit closed")
+            CIRCUIT_OPEN.labels(self.name).set(0)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def abandon_trial(self):
+        """Lets another call be the trial after this one was cancelled mid-flight."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        reopen = self._trial_in_flight
+        self._trial_in_flight = False
+        if reopen or (self.opened_at is None and self.failures >= self.failure_threshold):
+            print(f"Warning: {self.name} circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+            CIRCUIT_OPEN.labels(self.name).set(1)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (0-based), never shorter than `retry_after`."""
+    delay = random.uniform(0, min(UPSTREAM_RETRY_MAX_SECONDS, UPSTREAM_RETRY_BASE_SECONDS * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _transient_reason(error: Exception) -> Optional[str]:
+    """The retry reason for a transient failure, or None if retrying won't help."""
+    if isinstance(error, httpx.HTTPStatusError):
+        code = error.response.status_code
+        return str(code) if code in RETRYABLE_STATUS_CODES else None
+    if isinstance(error, RETRYABLE_TRANSPORT_ERRORS):
+        return type(error).__name__
+    return None
+
+
+async def call_with_retries(breaker: CircuitBreaker, call: Callable[[], Awaitable[T]],
+                            max_retries: int = UPSTREAM_MAX_RETRIES) -> T:
+    """
+    Runs `call` through `breaker`, retrying transient failures with backoff.
+    `call` must be safe to repeat (e.g. it rewinds its request body). The last
+    error is re-raised once retries run out, or straight away when the
+    upstream's Retry-After is longer than UPSTREAM_RETRY_MAX_SECONDS.
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = await call()
+        except Exception as e:
+            reason = _transient_reason(e)
+            if reason is None and not isinstance(e, httpx.TransportError):
+                # The upstream answered (e.g. a 400 for bad audio), so it is healthy
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if reason is None or attempt >= max_retries or breaker.state == "open":
+                raise
+            retry_after = None
+            if isinstance(e, httpx.HTTPStatusError):
+                retry_after = parse_retry_after(e.response.headers.get("retry-after"))
+            if retry_after is not None and retry_after > UPSTREAM_RETRY_MAX_SECONDS:
+                raise
+            delay = backoff_delay(attempt, retry_after)
+            print(f"{breaker.name} call failed ({reason}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            UPSTREAM_RETRIES.labels(breaker.name, reason).inc()
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled (e.g. by the caller's overall timeout): no verdict on the upstream
+            breaker.abandon_trial()
+            raise
+        breaker.record_success()
+        return result
+
+
+class UploadModeCache:
+    """
+    Remembers, per MIME type, which upload format an upstream accepted after
+    the default one was rejected, so later uploads of that type go straight
+    to the format that works instead of being sent twice.
+    """
+
+    # Entries kept; MIME types are few, this only guards against junk content types
+    MAX_ENTRIES = 256
+
+    def __init__(self):
+        self._modes: Dict[str, str] = {}
+
+    def get(self, mime_type: str, default: str) -> str:
+        return self._modes.get(mime_type.lower(), default)
+
+    def remember(self, mime_type: str, mode: str, default: str):
+        key = mime_type.lower()
+        if mode == default:
+            self._modes.pop(key, None)
+            return
+        if key not in self._modes and len(self._modes) >= self.MAX_ENTRIES:
+            self._modes.pop(next(iter(self._modes)))
+        self._modes[key] = mode
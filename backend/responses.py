@@ -0,0 +1,193 @@
+"""
+HTTP response helpers for the read endpoints: fast JSON encoding, strong
+ETags with conditional GET, and gzip/brotli compression.
+
+JSON is encoded with `orjson` (several times faster than the standard
+library on transcript-sized strings) and bodies are compressed with brotli
+when the client accepts it, gzip otherwise. Both packages are in
+requirements.txt; without them the standard `json` module and gzip are
+used.
+"""
+import os
+import gzip
+import json
+import hashlib
+from typing import Any, Iterable, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESPONSE_COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Smaller bodies are sent as they are: compressing them saves less than it costs
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+# Only buffered (non-streaming) responses of these types are compressed
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript")
+
+
+def json_dumps(content: Any) -> str:
+    """Serializes `content` to a JSON string, with orjson when available."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content).decode("utf-8")
+        except TypeError:
+            # e.g. non-string keys or integers beyond 64 bits
+            pass
+    return json.dumps(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(content)
+            except TypeError:
+                pass
+        return super().render(content)
+
+
+def make_etag(*parts: Any) -> str:
+    """A strong ETag (quoted) derived from `parts`, e.g. row ids and timestamps."""
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _etag_candidates(header: str) -> Iterable[str]:
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # CompressionMiddleware tags encoded bodies as "<etag>-gzip" / "<etag>-br"
+        for suffix in ('-gzip"', '-br"'):
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+        yield tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match already names `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in _etag_candidates(header)
+
+
+def cache_headers(etag: str) -> dict:
+    # no-cache: clients may store the body but must revalidate it (cheaply, via 304) before reuse
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks "br" or "gzip" from an Accept-Encoding header, or None."""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    Compresses buffered text/JSON responses of at least
+    RESPONSE_COMPRESSION_MIN_BYTES with brotli or gzip. Streaming responses
+    (SSE, NDJSON, files sent in several pieces) pass through untouched so
+    their events aren't held back by a compressor's buffer. Headers are only
+    held back for the first body message when the response could be
+    compressed; anything else (or a client that accepts no encoding) gets
+    them immediately.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RESPONSE_COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope.get("headers") or []:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                header_names = {k.lower() for k, _ in headers}
+                content_type = next((v.decode("latin-1") for k, v in headers if k.lower() == b"content-type"), "")
+                compressible = content_type.split(";")[0].strip() in COMPRESSIBLE_TYPES
+                if compressible and b"vary" not in header_names:
+                    headers.append((b"vary", b"Accept-Encoding"))
+                    message = dict(message, headers=headers)
+                content_length = next((v for k, v in headers if k.lower() == b"content-length"), None)
+                if (compressible and encoding and b"content-encoding" not in header_names
+                        and not (content_length and int(content_length) < RESPONSE_COMPRESSION_MIN_BYTES)):
+                    # Hold the headers until the first body message shows whether this streams
+                    start_message = message
+                    return
+                # Nothing to compress (e.g. SSE or NDJSON): send the headers straight away
+                await send(message)
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            if not message.get("more_body") and len(body) >= RESPONSE_COMPRESSION_MIN_BYTES:
+                compressed = compress_body(body, encoding)
+                if len(compressed) < len(body):
+                    body = compressed
+                    headers = [(k, v) for k, v in start["headers"] if k.lower() not in (b"content-length", b"etag")] + [
+                        (b"content-encoding", encoding.encode()),
+                        (b"content-length", str(len(body)).encode()),
+                    ]
+                    # A strong ETag names one exact byte sequence, so the encoded body gets its own
+                    etag = next((v for k, v in start["headers"] if k.lower() == b"etag"), None)
+                    if etag is not None and etag.endswith(b'"'):
+                        headers.append((b"etag", etag[:-1] + b"-" + encoding.encode() + b'"'))
+                    start = dict(start, headers=headers)
+                    message = dict(message, body=body)
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,169 @@
+"""
+Write-behind group commit for finished lecture results.
+
+Instead of one transaction (and one fsync) per lecture, results are queued
+in-process and a single background task inserts them in batches: a batch is
+written once RESULT_WRITE_BATCH_SIZE rows are waiting, or RESULT_WRITE_FLUSH_MS
+after its first row arrived, whichever comes first. Callers still await the
+new row's ID. Freshly generated notes are added to the notes cache in the
+same transaction as their row. `close()` flushes whatever is pending (the app lifespan and the
+worker call it on shutdown).
+"""
+import os
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.cache import NotesKey, notes_cache_upsert
+from backend.database import AsyncSessionLocal, LectureUpload
+
+# Most rows committed in one transaction
+RESULT_WRITE_BATCH_SIZE = int(os.getenv("RESULT_WRITE_BATCH_SIZE", "32"))
+# Longest a result waits for others to share its transaction
+RESULT_WRITE_FLUSH_MS = float(os.getenv("RESULT_WRITE_FLUSH_MS", "20"))
+
+_STOP = object()
+
+
+class ResultWriter:
+    """Batches LectureUpload inserts from concurrent callers into shared transactions."""
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.batches = 0
+        self.rows = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def save(self, values: Dict[str, Any]) -> Optional[int]:
+        """
+        Queues one LectureUpload row (as column values) and returns its ID once
+        the batch containing it is committed, or None if it couldn't be saved.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((values, future))
+        self._wakeup.set()
+        # If the caller goes away the row is still written
+        return await asyncio.shield(future)
+
+    async def close(self):
+        """Writes all pending rows and stops the background task."""
+        if self._task is None or self._task.done():
+            return
+        if self._loop is not asyncio.get_running_loop():
+            # The loop that owned the task is gone; nothing can be flushed from here
+            return
+        self._queue.put_nowait(_STOP)
+        self._wakeup.set()
+        await self._task
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = self._loop.time() + self.flush_interval
+
+            # Gather whatever else arrives before the batch is full or the deadline passes
+            while len(batch) < self.batch_size and not stopping:
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                remaining = deadline - self._loop.time()
+                if stopping or len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                self._wakeup.clear()
+                if not self._queue.empty():
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            await self._write(batch)
+
+        # Anything queued after the stop marker still gets written
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        for start in range(0, len(leftover), self.batch_size):
+            await self._write(leftover[start:start + self.batch_size])
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        try:
+            ids = await self._insert([values for values, _ in batch])
+        except Exception as e:
+            # Don't let one bad row fail the others: retry them one by one
+            print(f"Warning: Batched save of {len(batch)} results failed ({e}); retrying individually")
+            ids = []
+            for values, _ in batch:
+                try:
+                    ids.extend(await self._insert([values]))
+                except Exception as row_error:
+                    print(f"Warning: Failed to save to database: {row_error}")
+                    ids.append(None)
+
+        for (_, future), upload_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(upload_id)
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> List[int]:
+        uploads = []
+        cached_notes: Dict[NotesKey, str] = {}
+        for values in rows:
+            values = dict(values)
+            notes_key = values.pop("notes_key", None)
+            if notes_key is not None:
+                cached_notes[notes_key] = values["notes"]
+            uploads.append(LectureUpload(**values))
+        async with AsyncSessionLocal() as db:
+            db.add_all(uploads)
+            if cached_notes:
+                await db.execute(notes_cache_upsert(cached_notes))
+            await db.commit()
+        self.batches += 1
+        self.rows += len(uploads)
+        return [upload.id for upload in uploads]
+
+
+result_writer = ResultWriter(RESULT_WRITE_BATCH_SIZE, RESULT_WRITE_FLUSH_MS / 1000)
+
+
+def lecture_row(filename: str, file_size: int, file_type: str, transcript: str, notes: str,
+                content_hash: Optional[str] = None, word_timings: Optional[bytes] = None,
+                notes_key: Optional[NotesKey] = None) -> Dict[str, Any]:
+    """
+    Column values for a new LectureUpload, timestamped when the result
+    finished. With `notes_key`, the notes are also written to the notes cache
+    under that key.
+    """
+    return {
+        "filename": filename or "unknown",
+        "file_size": file_size,
+        "file_type": file_type or "unknown",
+        "transcript": transcript,
+        "notes": notes,
+        "content_hash": content_hash,
+        "word_timings": word_timings,
+        "created_at": datetime.utcnow(),
+        "notes_key": notes_key,
+    }
@@ -0,0 +1,90 @@
+"""
+Full-text search over stored transcripts and notes.
+
+Backed by the `lecture_search` FTS5 index (created and kept in sync by
+triggers in backend/database.py), so a query is an index lookup ranked by
+BM25 rather than a scan of every upload.
+"""
+import re
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import text, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend import database
+from backend.database import SEARCH_TABLE
+
+# Markers placed around matched terms in snippets
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+# Approximate number of tokens in each snippet
+SNIPPET_TOKENS = 24
+# Relative BM25 weights of the (transcript, notes) columns
+SEARCH_WEIGHTS = (1.0, 2.0)
+
+_TERM_RE = re.compile(r'[^\s"]+\*?')
+
+
+def search_enabled() -> bool:
+    """True once init_db() has set up the index (False if SQLite lacks FTS5)."""
+    return database.search_available
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 MATCH expression: every word must match
+    (quoted, so FTS syntax in user input can't cause errors), and a trailing
+    `*` keeps prefix matching.
+    """
+    terms = []
+    for term in _TERM_RE.findall(query):
+        prefix = term.endswith("*")
+        word = term.rstrip("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+async def search_uploads(db: AsyncSession, query: str, limit: int, offset: int) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Returns (hits, has_more) for `query`, best match first. Each hit carries
+    the upload's metadata, its BM25 score (lower is better) and highlighted
+    snippets from the transcript and notes.
+    """
+    match = build_match_query(query)
+    if not match:
+        return [], False
+
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    rows = (await db.execute(text(f"""
+        SELECT u.id, u.filename, u.file_size, u.file_type, u.created_at,
+               bm25({SEARCH_TABLE}, {weights}) AS score,
+               snippet({SEARCH_TABLE}, 0, :start, :end, '…', :tokens) AS transcript_snippet,
+               snippet({SEARCH_TABLE}, 1, :start, :end, '…', :tokens) AS notes_snippet
+        FROM {SEARCH_TABLE}
+        JOIN lecture_uploads AS u ON u.id = {SEARCH_TABLE}.rowid
+        WHERE {SEARCH_TABLE} MATCH :match
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+    """).columns(created_at=DateTime), {
+        "match": match,
+        "start": SNIPPET_START,
+        "end": SNIPPET_END,
+        "tokens": SNIPPET_TOKENS,
+        "limit": limit + 1,
+        "offset": offset,
+    })).fetchall()
+
+    hits = []
+    for row in rows[:limit]:
+        hits.append({
+            "id": row.id,
+            "filename": row.filename,
+            "file_size": row.file_size,
+            "file_type": row.file_type,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "score": round(row.score, 4),
+            "transcript_snippet": row.transcript_snippet,
+            "notes_snippet": row.notes_snippet,
+        })
+    return hits, len(rows) > limit
@@ -0,0 +1,209 @@
+"""
+Segmented transcription for long recordings.
+
+Long audio is split at silence boundaries with a local ffmpeg subprocess,
+the segments are transcribed concurrently (with a bounded fan-out), and the
+per-segment Deepgram results are stitched back together in order with word
+timestamps shifted by each segment's start offset.
+"""
+import os
+import re
+import asyncio
+import shutil
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+FFPROBE_PATH = os.getenv("FFPROBE_PATH", "ffprobe")
+SEGMENTATION_ENABLED = os.getenv("SEGMENTATION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Recordings longer than this are split (so are files over MAX_FILE_SIZE_MB)
+SEGMENT_THRESHOLD_SECONDS = float(os.getenv("SEGMENT_THRESHOLD_SECONDS", "1200"))
+# Target segment length; cuts snap to the nearest silence within +/- 25%
+SEGMENT_TARGET_SECONDS = float(os.getenv("SEGMENT_TARGET_SECONDS", "600"))
+# How many segments are transcribed at once for a single recording
+SEGMENT_CONCURRENCY = int(os.getenv("SEGMENT_CONCURRENCY", "4"))
+# What counts as silence for ffmpeg's silencedetect filter
+SILENCE_NOISE_DB = os.getenv("SILENCE_NOISE_DB", "-35dB")
+SILENCE_MIN_SECONDS = float(os.getenv("SILENCE_MIN_SECONDS", "0.5"))
+
+SEGMENT_MIME_TYPE = "audio/flac"
+
+_SILENCE_START_RE = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END_RE = re.compile(r"silence_end:\s*(-?[\d.]+)")
+
+
+class SegmentationError(Exception):
+    """Raised when an ffmpeg/ffprobe run fails (e.g. it cannot read the audio)."""
+
+
+def ffmpeg_available() -> bool:
+    """True if segmentation is enabled and both ffmpeg and ffprobe are on PATH."""
+    return SEGMENTATION_ENABLED and bool(shutil.which(FFMPEG_PATH)) and bool(shutil.which(FFPROBE_PATH))
+
+
+async def run_tool(*args: str) -> Tuple[bytes, bytes]:
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        message = stderr.decode(errors="replace").strip().splitlines()
+        raise SegmentationError(f"{os.path.basename(args[0])} failed: {message[-1] if message else process.returncode}")
+    return stdout, stderr
+
+
+async def probe_duration(file_path: str) -> float:
+    """Returns the duration of an audio file in seconds."""
+    stdout, _ = await run_tool(
+        FFPROBE_PATH, "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        file_path,
+    )
+    try:
+        return float(stdout.decode().strip())
+    except ValueError:
+        raise SegmentationError("ffprobe could not determine the audio duration")
+
+
+async def detect_silences(file_path: str) -> List[float]:
+    """Returns the midpoints (in seconds) of silent stretches in the audio."""
+    _, stderr = await run_tool(
+        FFMPEG_PATH, "-hide_banner", "-nostats", "-i", file_path,
+        "-vn", "-af", f"silencedetect=noise={SILENCE_NOISE_DB}:d={SILENCE_MIN_SECONDS}",
+        "-f", "null", "-",
+    )
+    output = stderr.decode(errors="replace")
+    starts = [float(m) for m in _SILENCE_START_RE.findall(output)]
+    ends = [float(m) for m in _SILENCE_END_RE.findall(output)]
+    return [(start + end) / 2 for start, end in zip(starts, ends)]
+
+
+def choose_cut_points(duration: float, silences: List[float], target: float = SEGMENT_TARGET_SECONDS) -> List[float]:
+    """
+    Picks cut points roughly every `target` seconds, snapping each one to the
+    nearest silence within a quarter of the target so words aren't split.
+    """
+    cuts = []
+    window = target * 0.25
+    last_cut = 0.0
+    while duration - last_cut > target + window:
+        ideal = last_cut + target
+        nearby = [s for s in silences if abs(s - ideal) <= window and s > last_cut]
+        cut = min(nearby, key=lambda s: abs(s - ideal)) if nearby else ideal
+        cuts.append(round(cut, 3))
+        last_cut = cut
+    return cuts
+
+
+async def split_audio(file_path: str, cut_points: List[float], out_dir: str) -> List[str]:
+    """
+    Splits the audio at `cut_points` into mono FLAC segments in one ffmpeg pass
+    (re-encoding keeps the cuts sample-accurate) and returns their paths in order.
+    """
+    pattern = os.path.join(out_dir, "segment_%04d.flac")
+    args = [FFMPEG_PATH, "-hide_banner", "-nostats", "-loglevel", "error", "-i", file_path,
+            "-vn", "-ac", "1", "-c:a", "flac", "-f", "segment", "-reset_timestamps", "1"]
+    if cut_points:
+        args += ["-segment_times", ",".join(f"{c:.3f}" for c in cut_points)]
+    args.append(pattern)
+    await run_tool(*args)
+    return sorted(
+        os.path.join(out_dir, name) for name in os.listdir(out_dir) if name.startswith("segment_")
+    )
+
+
+def stitch_results(results: List[Dict[str, Any]], offsets: List[float], duration: float) -> Dict[str, Any]:
+    """
+    Merges per-segment Deepgram responses into one response of the same shape,
+    shifting word timestamps by each segment's offset into the recording.
+    """
+    transcripts = []
+    words = []
+    confidences = []
+    for result, offset in zip(results, offsets):
+        alternative = result["results"]["channels"][0]["alternatives"][0]
+        text = (alternative.get("transcript") or "").strip()
+        if text:
+            transcripts.append(text)
+        if alternative.get("confidence") is not None:
+            confidences.append(alternative["confidence"])
+        for word in alternative.get("words", []):
+            shifted = dict(word)
+            shifted["start"] = round(word["start"] + offset, 3)
+            shifted["end"] = round(word["end"] + offset, 3)
+            words.append(shifted)
+
+    return {
+        "metadata": {"duration": duration, "segments": len(results)},
+        "results": {
+            "channels": [{
+                "alternatives": [{
+                    "transcript": "\n\n".join(transcripts),
+                    "confidence": sum(confidences) / len(confidences) if confidences else None,
+                    "words": words,
+                }]
+            }]
+        },
+    }
+
+
+async def should_segment(file_path: Optional[str], file_size: int, max_single_bytes: int) -> Tuple[bool, float]:
+    """
+    Decides whether a file should go through segmented transcription and
+    returns (decision, duration). Files without a path on disk, or when ffmpeg
+    isn't available, are never segmented.
+    """
+    if not file_path or not ffmpeg_available():
+        return False, 0.0
+    duration = await probe_duration(file_path)
+    return duration > SEGMENT_THRESHOLD_SECONDS or file_size > max_single_bytes, duration
+
+
+async def transcribe_segmented(
+    file_path: str,
+    filename: str,
+    duration: float,
+    transcribe_one: Callable[[str, str, str, int], Awaitable[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    Splits `file_path` at silences, runs `transcribe_one(path, filename,
+    mime_type, size)` over the segments with at most SEGMENT_CONCURRENCY in
+    flight, and returns the stitched Deepgram-shaped result.
+    """
+    silences = await detect_silences(file_path)
+    cut_points = choose_cut_points(duration, silences)
+    print(f"Splitting {filename} ({duration / 60:.1f} min) into {len(cut_points) + 1} segments")
+
+    with tempfile.TemporaryDirectory(prefix="lecture_segments_") as out_dir:
+        segment_paths = await split_audio(file_path, cut_points, out_dir)
+        offsets = [0.0] + cut_points
+        if len(segment_paths) != len(offsets):
+            # ffmpeg may drop a trailing empty segment; offsets stay aligned from the start
+            offsets = offsets[:len(segment_paths)]
+
+        semaphore = asyncio.Semaphore(SEGMENT_CONCURRENCY)
+
+        async def run_segment(index: int, path: str) -> Dict[str, Any]:
+            async with semaphore:
+                name = f"{filename} [part {index + 1}/{len(segment_paths)}]"
+                return await transcribe_one(path, name, SEGMENT_MIME_TYPE, os.path.getsize(path))
+
+        tasks = [asyncio.ensure_future(run_segment(i, p)) for i, p in enumerate(segment_paths)]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed segment fails the recording; don't keep paying for the rest
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    return stitch_results(results, offsets, duration)
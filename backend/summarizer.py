@@ -0,0 +1,288 @@
+"""
+Lecture summarization with Google Gemini.
+
+Transcripts that fit the token budget are summarized in a single call.
+Longer ones are summarized map-reduce style: the transcript is chunked on
+sentence boundaries, the chunks are summarized concurrently, and a final
+call merges the partial summaries into the usual four-section notes.
+"""
+import os
+import re
+import sys
+import asyncio
+import hashlib
+import inspect
+import concurrent.futures
+from typing import AsyncIterator, List
+
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+from backend.metrics import track_stage
+
+load_dotenv()
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Overridable so benchmarks and tests can point at a local stub server
+GEMINI_API_URL = os.getenv("GEMINI_API_URL")
+
+# The google-genai SDK takes about half a second to import, so it is imported
+# and the client built on first use rather than on every cold start
+_gemini_client = None
+_gemini_client_ready = False
+
+
+def get_gemini_client():
+    """Returns the shared Gemini client, creating it on first use (None if that failed)."""
+    global _gemini_client, _gemini_client_ready
+    if not _gemini_client_ready:
+        try:
+            from google import genai
+
+            _gemini_client = genai.Client(
+                api_key=GEMINI_API_KEY,
+                http_options={"base_url": GEMINI_API_URL} if GEMINI_API_URL else None,
+            )
+        except Exception as e:
+            print(f"Error initializing Gemini client: {e}")
+            _gemini_client = None
+        _gemini_client_ready = True
+    return _gemini_client
+
+
+def is_gemini_api_error(e: Exception) -> bool:
+    """True if `e` came from the Gemini API (without importing the SDK just to check)."""
+    errors = sys.modules.get("google.genai.errors")
+    return errors is not None and isinstance(e, errors.APIError)
+
+# Using gemini-2.5-flash for fast and capable summarization
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Transcripts estimated above this many tokens are summarized map-reduce style
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "30000"))
+# Target size of each map chunk
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "8000"))
+# How many chunk summaries are generated at once for a single transcript
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+# Rough characters-per-token ratio used to estimate transcript size locally
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+# Upper bound on a single Gemini call, and on Gemini calls in flight process-wide
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "120"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
+# Shared by every request so a burst of summaries can't flood Gemini (or threads)
+_gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+# Only used if the installed SDK has no async client
+_gemini_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini"
+)
+
+NOTES_FORMAT = """The notes must strictly follow this format:
+1.  **One-Sentence Summary**: A single, concise sentence summarizing the main topic of the lecture.
+2.  **Key Takeaways**: A bulleted list of 5 to 15 key points from the lecture.
+3.  **Key Terms/Concepts**: A list of 5 important terms or concepts introduced.
+4.  **Follow-up Questions**: A list of 3 thought-provoking questions for students to consider or research further.
+"""
+
+# LLM Prompt for summarization
+SUMMARIZATION_PROMPT = """
+You are an expert academic assistant. Your task is to analyze the provided lecture transcript and generate clean, structured notes.
+
+""" + NOTES_FORMAT + """
+Lecture Transcript:
+---
+{transcript}
+---
+"""
+
+# Map step: condense one part of a long transcript
+CHUNK_SUMMARY_PROMPT = """
+You are an expert academic assistant. Below is part {part} of {total} of a lecture transcript.
+Summarize this part in detail: list every main point, definition, example and key term it covers, in the order they appear.
+Do not add an introduction or conclusion; the summaries of all parts will be merged later.
+
+Transcript Part {part} of {total}:
+---
+{transcript}
+---
+"""
+
+# Reduce step: merge the part summaries into the final notes
+REDUCE_PROMPT = """
+You are an expert academic assistant. The lecture transcript was too long to read at once, so it was split into parts and each part was summarized in order.
+Using these part summaries, generate clean, structured notes for the whole lecture.
+
+""" + NOTES_FORMAT + """
+Part Summaries:
+---
+{summaries}
+---
+"""
+
+
+def notes_prompt_hash() -> str:
+    """
+    SHA-256 of everything besides the transcript and model that shapes the
+    notes: the prompts and the map-reduce chunking settings. Editing any of
+    them changes the hash, so notes cached under the old one are not reused.
+    """
+    parts = [SUMMARIZATION_PROMPT, CHUNK_SUMMARY_PROMPT, REDUCE_PROMPT,
+             str(SUMMARY_TOKEN_BUDGET), str(SUMMARY_CHUNK_TOKENS), str(CHARS_PER_TOKEN)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the token count of `text` without calling the API."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def chunk_on_sentences(text: str, max_tokens: int) -> List[str]:
+    """
+    Splits `text` into chunks of at most ~`max_tokens`, breaking only between
+    sentences (or between words, for a single over-long sentence).
+    """
+    max_chars = max(1, int(max_tokens * CHARS_PER_TOKEN))
+    chunks = []
+    current = []
+    current_len = 0
+
+    def flush():
+        nonlocal current, current_len
+        if current:
+            chunks.append(" ".join(current))
+        current, current_len = [], 0
+
+    for sentence in _SENTENCE_END_RE.split(text.strip()):
+        if not sentence:
+            continue
+        pieces = [sentence]
+        if len(sentence) > max_chars:
+            # No sentence boundary to use (e.g. unpunctuated speech); fall back to words
+            pieces, piece = [], []
+            for word in sentence.split():
+                if piece and len(" ".join(piece)) + len(word) + 1 > max_chars:
+                    pieces.append(" ".join(piece))
+                    piece = []
+                piece.append(word)
+            if piece:
+                pieces.append(" ".join(piece))
+        for piece in pieces:
+            if current and current_len + len(piece) + 1 > max_chars:
+                flush()
+            current.append(piece)
+            current_len += len(piece) + 1
+    flush()
+    return chunks
+
+
+async def _generate_content(prompt: str):
+    gemini_client = get_gemini_client()
+    aio = getattr(gemini_client, "aio", None)
+    if aio is not None:
+        return await aio.models.generate_content(model=GEMINI_MODEL, contents=prompt)
+    # The sync SDK call would block the event loop; run it on the bounded executor
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _gemini_executor,
+        lambda: gemini_client.models.generate_content(model=GEMINI_MODEL, contents=prompt)
+    )
+
+
+async def generate_text(prompt: str) -> str:
+    """
+    Runs one Gemini generation without blocking the event loop and returns
+    the stripped response text. At most GEMINI_MAX_CONCURRENCY calls run at
+    once; each is limited to GEMINI_TIMEOUT_SECONDS.
+    """
+    async with _gemini_semaphore:
+        try:
+            chat_response = await asyncio.wait_for(_generate_content(prompt), timeout=GEMINI_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Summarization timeout: The Gemini API took longer than {GEMINI_TIMEOUT_SECONDS:.0f} seconds to respond. Please try again."
+            )
+    return chat_response.text.strip()
+
+
+async def _summarize_chunks(chunks: List[str]) -> List[str]:
+    """Map step: summarizes the chunks concurrently, returning summaries in order."""
+    semaphore = asyncio.Semaphore(SUMMARY_MAP_CONCURRENCY)
+
+    async def summarize_chunk(index: int, chunk: str) -> str:
+        async with semaphore:
+            return await generate_text(CHUNK_SUMMARY_PROMPT.format(
+                part=index + 1, total=len(chunks), transcript=chunk
+            ))
+
+    return await asyncio.gather(*(summarize_chunk(i, c) for i, c in enumerate(chunks)))
+
+
+async def _build_notes_prompt(transcript: str) -> str:
+    """
+    Returns the prompt that produces the final notes: the transcript itself
+    if it fits the token budget, otherwise a reduce prompt over concurrently
+    generated chunk summaries (the map step runs here).
+    """
+    if estimate_tokens(transcript) <= SUMMARY_TOKEN_BUDGET:
+        return SUMMARIZATION_PROMPT.format(transcript=transcript)
+
+    chunks = chunk_on_sentences(transcript, SUMMARY_CHUNK_TOKENS)
+    print(f"Transcript exceeds {SUMMARY_TOKEN_BUDGET} tokens; summarizing {len(chunks)} chunks")
+    summaries = await _summarize_chunks(chunks)
+    merged = "\n\n".join(f"Part {i + 1}:\n{s}" for i, s in enumerate(summaries))
+
+    # Very long lectures: condense the part summaries again until they fit
+    rounds = 0
+    while estimate_tokens(merged) > SUMMARY_TOKEN_BUDGET and len(summaries) > 1 and rounds < 3:
+        rounds += 1
+        summaries = await _summarize_chunks(chunk_on_sentences(merged, SUMMARY_CHUNK_TOKENS))
+        merged = "\n\n".join(f"Part {i + 1}:\n{s}" for i, s in enumerate(summaries))
+
+    return REDUCE_PROMPT.format(summaries=merged)
+
+
+async def summarize_transcript(transcript: str) -> str:
+    """Generates structured notes for a transcript with Google Gemini."""
+    with track_stage("summarization"):
+        return await generate_text(await _build_notes_prompt(transcript))
+
+
+async def stream_summary(transcript: str) -> AsyncIterator[str]:
+    """
+    Like summarize_transcript, but yields the notes in pieces as Gemini
+    streams them. Concatenating the pieces gives the full (unstripped) notes.
+    """
+    with track_stage("summarization"):
+        async for piece in _stream_summary(transcript):
+            yield piece
+
+
+async def _stream_summary(transcript: str) -> AsyncIterator[str]:
+    prompt = await _build_notes_prompt(transcript)
+    aio = getattr(get_gemini_client(), "aio", None)
+    if aio is None or not hasattr(aio.models, "generate_content_stream"):
+        yield await generate_text(prompt)
+        return
+
+    async with _gemini_semaphore:
+        try:
+            stream = aio.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt)
+            if inspect.isawaitable(stream):
+                # Newer SDKs return the async iterator from a coroutine
+                stream = await asyncio.wait_for(stream, timeout=GEMINI_TIMEOUT_SECONDS)
+            iterator = stream.__aiter__()
+            while True:
+                # The timeout applies to each gap between streamed pieces
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=GEMINI_TIMEOUT_SECONDS)
+                except StopAsyncIteration:
+                    break
+                if chunk.text:
+                    yield chunk.text
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Summarization timeout: The Gemini API took longer than {GEMINI_TIMEOUT_SECONDS:.0f} seconds to respond. Please try again."
+            )
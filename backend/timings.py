@@ -0,0 +1,139 @@
+"""
+Compact storage of Deepgram's word-level timings.
+
+The words of a transcript are packed into one binary blob (stored in
+`LectureUpload.word_timings`) as parallel little-endian arrays:
+
+    header    b"WT", version (u8), reserved (u8), word count N (u32), text bytes (u32)
+    starts    N x float32   seconds, non-decreasing
+    ends      N x float32   seconds
+    conf      N x uint16    confidence scaled to 0..65535
+    (padding to a multiple of 4 bytes)
+    offsets   (N + 1) x uint32   byte offsets of each word in `text`
+    text      the words, UTF-8, back to back
+
+A time range is looked up by binary search directly on the `starts` array
+(a memoryview over the blob), and only the words inside it are decoded, so
+seeking stays O(log n) however long the lecture is.
+"""
+import sys
+import array
+import bisect
+import struct
+from typing import Any, Dict, List, Optional
+
+MAGIC = b"WT"
+VERSION = 1
+_HEADER = struct.Struct("<2sBBII")
+_CONFIDENCE_SCALE = 65535
+
+
+def _little_endian_bytes(values: array.array) -> bytes:
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def pack_word_timings(words: List[Dict[str, Any]]) -> Optional[bytes]:
+    """
+    Packs Deepgram `words` (dicts with start, end, confidence and word or
+    punctuated_word) into the blob format, or returns None if there are none.
+    """
+    if not words:
+        return None
+    words = sorted(words, key=lambda w: w.get("start") or 0.0)
+    starts = array.array("f")
+    ends = array.array("f")
+    confidences = array.array("H")
+    offsets = array.array("I", [0])
+    text = bytearray()
+    for word in words:
+        starts.append(float(word.get("start") or 0.0))
+        ends.append(float(word.get("end") or 0.0))
+        confidence = min(1.0, max(0.0, float(word.get("confidence") or 0.0)))
+        confidences.append(round(confidence * _CONFIDENCE_SCALE))
+        text += (word.get("punctuated_word") or word.get("word") or "").encode("utf-8")
+        offsets.append(len(text))
+
+    count = len(starts)
+    parts = [
+        _HEADER.pack(MAGIC, VERSION, 0, count, len(text)),
+        _little_endian_bytes(starts),
+        _little_endian_bytes(ends),
+        _little_endian_bytes(confidences),
+        b"\x00" * ((-2 * count) % 4),
+        _little_endian_bytes(offsets),
+        bytes(text),
+    ]
+    return b"".join(parts)
+
+
+def pack_result_word_timings(result: Dict[str, Any]) -> Optional[bytes]:
+    """Packs the word timings of a Deepgram response (None if it has none)."""
+    try:
+        words = result["results"]["channels"][0]["alternatives"][0].get("words")
+    except (KeyError, IndexError, TypeError):
+        return None
+    return pack_word_timings(words or [])
+
+
+class WordTimings:
+    """Read-only view over a packed blob; nothing is decoded until words are sliced out."""
+
+    def __init__(self, blob: bytes):
+        magic, version, _, count, text_len = _HEADER.unpack_from(blob)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Unrecognized word timings format")
+        self.count = count
+        view = memoryview(blob)
+        position = _HEADER.size
+        self._starts = self._array(view, position, count, "f")
+        position += 4 * count
+        self._ends = self._array(view, position, count, "f")
+        position += 4 * count
+        self._confidences = self._array(view, position, count, "H")
+        position += 2 * count + (-2 * count) % 4
+        self._offsets = self._array(view, position, count + 1, "I")
+        position += 4 * (count + 1)
+        self._text = view[position:position + text_len]
+
+    @staticmethod
+    def _array(view: memoryview, position: int, length: int, typecode: str):
+        size = array.array(typecode).itemsize
+        chunk = view[position:position + length * size]
+        if sys.byteorder == "big":
+            # Rare: decode into a native array instead of casting in place
+            values = array.array(typecode, chunk.tobytes())
+            values.byteswap()
+            return values
+        return chunk.cast(typecode)
+
+    @property
+    def duration(self) -> float:
+        return max(self._ends[self.count - 1], self._starts[self.count - 1]) if self.count else 0.0
+
+    def index_range(self, start: float, end: Optional[float] = None) -> range:
+        """Indexes of the words overlapping [start, end) seconds, found by binary search."""
+        lo = bisect.bisect_left(self._starts, start)
+        # Include a word that started earlier but is still being spoken at `start`
+        while lo > 0 and self._ends[lo - 1] > start:
+            lo -= 1
+        hi = self.count if end is None else bisect.bisect_left(self._starts, end)
+        return range(lo, max(lo, hi))
+
+    def words(self, indexes: range) -> List[Dict[str, Any]]:
+        return [
+            {
+                "word": bytes(self._text[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8"),
+                "start": round(self._starts[i], 3),
+                "end": round(self._ends[i], 3),
+                "confidence": round(self._confidences[i] / _CONFIDENCE_SCALE, 4),
+            }
+            for i in indexes
+        ]
+
+    def text(self, indexes: range) -> str:
+        return " ".join(
+            bytes(self._text[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8") for i in indexes
+        )
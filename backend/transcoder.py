@@ -0,0 +1,128 @@
+"""
+Optional transcoding of uploads before they are sent to Deepgram.
+
+Lecture recordings often arrive as 48kHz stereo WAV or high-bitrate video,
+and uploading those bytes dominates transcription latency. When enabled,
+audio above TRANSCODE_SKIP_BITRATE_KBPS is re-encoded to 16kHz mono Opus
+(or FLAC) by a local ffmpeg subprocess, at most TRANSCODE_CONCURRENCY at a
+time per process. Inputs that are already compact, too small to be worth a
+subprocess, or that ffmpeg can't read are sent unchanged.
+"""
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from backend.metrics import TRANSCODE_BYTES, TRANSCODE_BYTES_SAVED, TRANSCODES, track_stage
+from backend.segmenter import FFMPEG_PATH, FFPROBE_PATH, SegmentationError, run_tool
+
+TRANSCODE_ENABLED = os.getenv("TRANSCODE_ENABLED", "false").lower() in ("1", "true", "yes")
+# "opus" (smallest, Ogg container) or "flac" (lossless)
+TRANSCODE_FORMAT = os.getenv("TRANSCODE_FORMAT", "opus").lower()
+TRANSCODE_SAMPLE_RATE = int(os.getenv("TRANSCODE_SAMPLE_RATE", "16000"))
+TRANSCODE_OPUS_BITRATE = os.getenv("TRANSCODE_OPUS_BITRATE", "24k")
+# Inputs at or below this bitrate are already compact and sent as they are
+TRANSCODE_SKIP_BITRATE_KBPS = float(os.getenv("TRANSCODE_SKIP_BITRATE_KBPS", "64"))
+# Smaller files upload faster than ffmpeg starts
+TRANSCODE_MIN_BYTES = int(os.getenv("TRANSCODE_MIN_BYTES", str(512 * 1024)))
+# ffmpeg processes running at once (they are CPU bound)
+TRANSCODE_CONCURRENCY = int(os.getenv("TRANSCODE_CONCURRENCY", str(os.cpu_count() or 2)))
+
+_FORMATS = {
+    "opus": (["-c:a", "libopus", "-b:a", TRANSCODE_OPUS_BITRATE, "-application", "voip", "-f", "ogg"],
+             ".ogg", "audio/ogg"),
+    "flac": (["-c:a", "flac", "-sample_fmt", "s16", "-f", "flac"], ".flac", "audio/flac"),
+}
+
+_transcode_semaphore = asyncio.Semaphore(max(1, TRANSCODE_CONCURRENCY))
+
+
+def transcoding_available() -> bool:
+    """True if transcoding is enabled and both ffmpeg and ffprobe are on PATH."""
+    return TRANSCODE_ENABLED and bool(shutil.which(FFMPEG_PATH)) and bool(shutil.which(FFPROBE_PATH))
+
+
+async def probe_audio(file_path: str) -> Dict[str, Any]:
+    """Returns the first audio stream's codec, sample rate, channels and bitrate (bits/s, or None)."""
+    stdout, _ = await run_tool(
+        FFPROBE_PATH, "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name,sample_rate,channels,bit_rate:format=bit_rate",
+        "-of", "json", file_path,
+    )
+    info = json.loads(stdout or b"{}")
+    streams = info.get("streams") or []
+    if not streams:
+        raise SegmentationError("ffprobe found no audio stream")
+    stream = streams[0]
+    # Containers like Ogg/WebM only report the overall bitrate
+    bit_rate = stream.get("bit_rate") or (info.get("format") or {}).get("bit_rate")
+    return {
+        "codec": stream.get("codec_name"),
+        "sample_rate": int(stream.get("sample_rate") or 0),
+        "channels": int(stream.get("channels") or 0),
+        "bit_rate": int(bit_rate) if bit_rate not in (None, "N/A") else None,
+    }
+
+
+def skip_reason(info: Dict[str, Any]) -> Optional[str]:
+    """Why an input with this probe info should be sent unchanged, or None to transcode it."""
+    bit_rate = info.get("bit_rate")
+    if bit_rate is not None and bit_rate <= TRANSCODE_SKIP_BITRATE_KBPS * 1000:
+        return "compact"
+    return None
+
+
+async def transcode(file_path: str, out_dir: str) -> Tuple[str, str]:
+    """Re-encodes `file_path` to mono TRANSCODE_SAMPLE_RATE audio in `out_dir`; returns (path, MIME type)."""
+    codec_args, extension, mime_type = _FORMATS.get(TRANSCODE_FORMAT, _FORMATS["opus"])
+    out_path = os.path.join(out_dir, "transcoded" + extension)
+    async with _transcode_semaphore:
+        await run_tool(
+            FFMPEG_PATH, "-hide_banner", "-nostats", "-loglevel", "error", "-i", file_path,
+            "-vn", "-ac", "1", "-ar", str(TRANSCODE_SAMPLE_RATE), *codec_args, "-y", out_path,
+        )
+    return out_path, mime_type
+
+
+@asynccontextmanager
+async def prepared_audio(file_path: Optional[str], filename: str, content_type: str,
+                         file_size: int) -> AsyncIterator[Tuple[Optional[str], str, int]]:
+    """
+    Yields (path, MIME type, size) of the audio to upload: a compact transcode
+    of `file_path` when that helps, otherwise the original. The transcode is
+    deleted on exit.
+    """
+    if not file_path or not transcoding_available():
+        yield file_path, content_type, file_size
+        return
+    if file_size < TRANSCODE_MIN_BYTES:
+        TRANSCODES.labels("small").inc()
+        yield file_path, content_type, file_size
+        return
+
+    with tempfile.TemporaryDirectory(prefix="lecture_transcode_") as out_dir:
+        outcome, result = None, (file_path, content_type, file_size)
+        try:
+            with track_stage("transcode"):
+                outcome = skip_reason(await probe_audio(file_path))
+                if outcome is None:
+                    path, mime_type = await transcode(file_path, out_dir)
+                    size = os.path.getsize(path)
+                    if size < file_size:
+                        outcome, result = "transcoded", (path, mime_type, size)
+                    else:
+                        outcome = "not_smaller"
+        except (SegmentationError, OSError, ValueError) as e:
+            print(f"Transcoding {filename} failed, uploading the original: {e}")
+            outcome, result = "failed", (file_path, content_type, file_size)
+
+        TRANSCODES.labels(outcome).inc()
+        if outcome == "transcoded":
+            TRANSCODE_BYTES.labels("in").inc(file_size)
+            TRANSCODE_BYTES.labels("out").inc(result[2])
+            TRANSCODE_BYTES_SAVED.inc(file_size - result[2])
+            print(f"Transcoded {filename}: {file_size / 1024 / 1024:.2f} MB -> {result[2] / 1024 / 1024:.2f} MB")
+        yield result
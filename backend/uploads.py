@@ -0,0 +1,232 @@
+"""
+Resumable chunked uploads.
+
+A client that can't send a lecture in one request (Vercel caps request bodies
+at 4.5MB, and a dropped connection would mean starting over) creates an
+upload, PUTs numbered chunks in any order (retrying any that fail), asks
+which chunks have arrived, then finalizes. Each chunk is written straight
+into its place in a preallocated file, so finalizing only checks that
+every chunk is there and moves the file out (a rename, no copy) for the
+pipeline.
+
+State lives on disk under RESUMABLE_UPLOAD_DIR, one directory per upload:
+`manifest.json`, the `data` file, and `chunks` with one byte per chunk set
+once that chunk is written. Every worker process on the host sees the same
+state; all chunks of an upload must reach the same disk.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import tempfile
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+RESUMABLE_UPLOAD_DIR = os.getenv("RESUMABLE_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "lecture_uploads"))
+# Chunk size handed to clients; keep it under the platform's request body limit
+RESUMABLE_CHUNK_BYTES = int(os.getenv("RESUMABLE_CHUNK_BYTES", str(2 * 1024 * 1024)))
+MAX_RESUMABLE_CHUNK_BYTES = int(os.getenv("MAX_RESUMABLE_CHUNK_BYTES", str(4 * 1024 * 1024)))
+# Largest file accepted this way (Deepgram takes up to 2GB per request)
+MAX_RESUMABLE_UPLOAD_MB = int(os.getenv("MAX_RESUMABLE_UPLOAD_MB", "500"))
+# Unfinished uploads idle for longer than this are deleted
+RESUMABLE_UPLOAD_TTL_SECONDS = float(os.getenv("RESUMABLE_UPLOAD_TTL_SECONDS", "86400"))
+
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_WRITE_BLOCK = 1024 * 1024
+
+
+def _upload_dir(upload_id: str) -> str:
+    return os.path.join(RESUMABLE_UPLOAD_DIR, upload_id)
+
+
+def _chunk_count(size: int, chunk_size: int) -> int:
+    return max(1, -(-size // chunk_size))
+
+
+def create_upload(filename: str, content_type: str, size: int, chunk_size: Optional[int] = None,
+                  sha256: Optional[str] = None) -> Dict[str, Any]:
+    """Starts an upload of `size` bytes and returns its manifest."""
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be greater than zero.")
+    if size > MAX_RESUMABLE_UPLOAD_MB * 1024 * 1024:
+        raise HTTPException(status_code=400, detail=f"File size exceeds the limit of {MAX_RESUMABLE_UPLOAD_MB}MB.")
+    chunk_size = min(chunk_size or RESUMABLE_CHUNK_BYTES, MAX_RESUMABLE_CHUNK_BYTES)
+    if chunk_size < 64 * 1024:
+        raise HTTPException(status_code=400, detail="Chunk size must be at least 64 KB.")
+
+    purge_expired_uploads()
+    upload_id = uuid.uuid4().hex
+    directory = _upload_dir(upload_id)
+    os.makedirs(directory)
+    manifest = {
+        "upload_id": upload_id,
+        "filename": os.path.basename(filename or "audio"),
+        "content_type": content_type,
+        "size": size,
+        "chunk_size": chunk_size,
+        "total_chunks": _chunk_count(size, chunk_size),
+        "sha256": sha256.lower() if sha256 else None,
+        "created_at": time.time(),
+    }
+    # Sparse files: no disk is used until chunks arrive
+    with open(os.path.join(directory, "data"), "wb") as f:
+        f.truncate(size)
+    with open(os.path.join(directory, "chunks"), "wb") as f:
+        f.truncate(manifest["total_chunks"])
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def load_upload(upload_id: str) -> Dict[str, Any]:
+    """Returns the manifest of an unfinished upload, or raises a 404."""
+    if not _UPLOAD_ID_RE.match(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        with open(os.path.join(_upload_dir(upload_id), "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+def received_chunks(manifest: Dict[str, Any]) -> List[int]:
+    """Indexes of the chunks written so far."""
+    try:
+        with open(os.path.join(_upload_dir(manifest["upload_id"]), "chunks"), "rb") as f:
+            marks = f.read()
+    except OSError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return [i for i, mark in enumerate(marks) if mark]
+
+
+def received_bytes(manifest: Dict[str, Any], received: List[int]) -> int:
+    """Bytes received contiguously from the start of the file."""
+    index = 0
+    received_set = set(received)
+    while index in received_set:
+        index += 1
+    return min(manifest["size"], index * manifest["chunk_size"])
+
+
+def format_ranges(indexes: List[int]) -> str:
+    """Formats sorted chunk indexes compactly, e.g. [0, 1, 2, 5] -> "0-2,5"."""
+    ranges = []
+    for index in indexes:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+
+def _write_at(path: str, offset: int, data: bytes):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+async def write_chunk(manifest: Dict[str, Any], index: int, body: AsyncIterator[bytes],
+                      offset: Optional[int] = None):
+    """
+    Writes chunk `index` from the request `body` into its place in the file.
+    Writing a chunk again (e.g. a retry) just overwrites it.
+    """
+    if not 0 <= index < manifest["total_chunks"]:
+        raise HTTPException(status_code=400, detail=f"Chunk index must be between 0 and {manifest['total_chunks'] - 1}.")
+    start = index * manifest["chunk_size"]
+    if offset is not None and offset != start:
+        raise HTTPException(status_code=400, detail=f"Chunk {index} starts at offset {start}, not {offset}.")
+    expected = min(manifest["chunk_size"], manifest["size"] - start)
+
+    directory = _upload_dir(manifest["upload_id"])
+    data_path = os.path.join(directory, "data")
+    marks_path = os.path.join(directory, "chunks")
+    written = 0
+    buffer = bytearray()
+    try:
+        # A rewrite that fails halfway must not leave the chunk marked as received
+        await asyncio.to_thread(_write_at, marks_path, index, b"\x00")
+        async for piece in body:
+            if written + len(buffer) + len(piece) > expected:
+                raise HTTPException(status_code=413, detail=f"Chunk {index} must be exactly {expected} bytes.")
+            buffer += piece
+            if len(buffer) >= _WRITE_BLOCK:
+                await asyncio.to_thread(_write_at, data_path, start + written, bytes(buffer))
+                written += len(buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(_write_at, data_path, start + written, bytes(buffer))
+            written += len(buffer)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if written != expected:
+        raise HTTPException(status_code=400, detail=f"Chunk {index} must be exactly {expected} bytes, got {written}.")
+    # Mark the chunk only after its bytes are in place
+    await asyncio.to_thread(_write_at, marks_path, index, b"\x01")
+
+
+def _hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(_WRITE_BLOCK):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+async def claim_upload(manifest: Dict[str, Any], destination_dir: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Finishes a fully received upload: moves its file into `destination_dir`
+    (the temp directory by default), deletes the upload's state and returns
+    (path, SHA-256 hex digest). Raises a 409 listing missing chunks, and only
+    one caller can claim a given upload.
+    """
+    received = received_chunks(manifest)
+    if len(received) < manifest["total_chunks"]:
+        missing = sorted(set(range(manifest["total_chunks"])) - set(received))
+        raise HTTPException(status_code=409, detail=f"Upload is incomplete; missing chunks: {format_ranges(missing)}")
+
+    directory = _upload_dir(manifest["upload_id"])
+    destination_dir = destination_dir or tempfile.gettempdir()
+    os.makedirs(destination_dir, exist_ok=True)
+    file_path = os.path.join(destination_dir, f"uploaded_audio_{manifest['upload_id']}_{manifest['filename']}")
+    try:
+        # Same filesystem: an atomic rename. Otherwise shutil.move falls back to copying.
+        await asyncio.to_thread(shutil.move, os.path.join(directory, "data"), file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=409, detail="Upload is already being finalized")
+    shutil.rmtree(directory, ignore_errors=True)
+
+    content_hash = await asyncio.to_thread(_hash_file, file_path)
+    if manifest.get("sha256") and manifest["sha256"] != content_hash:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail="Upload checksum mismatch: the assembled file is corrupt. Please upload it again.")
+    return file_path, content_hash
+
+
+def delete_upload(upload_id: str):
+    load_upload(upload_id)
+    shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
+
+
+def purge_expired_uploads():
+    """Deletes unfinished uploads that haven't received a chunk for RESUMABLE_UPLOAD_TTL_SECONDS."""
+    try:
+        names = os.listdir(RESUMABLE_UPLOAD_DIR)
+    except FileNotFoundError:
+        return
+    cutoff = time.time() - RESUMABLE_UPLOAD_TTL_SECONDS
+    for name in names:
+        path = os.path.join(RESUMABLE_UPLOAD_DIR, name)
+        try:
+            # The chunk marks are rewritten with every chunk; fall back to the directory
+            marks = os.path.join(path, "chunks")
+            last_activity = os.path.getmtime(marks if os.path.exists(marks) else path)
+            if _UPLOAD_ID_RE.match(name) and last_activity < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
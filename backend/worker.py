@@ -0,0 +1,299 @@
+"""
+Background worker for the lecture processing job queue.
+
+Jobs are submitted through `POST /jobs` and stored in the `lecture_jobs`
+table. Run one or more workers next to the web server:
+
+    python -m backend.worker --concurrency 4
+
+Each worker claims queued jobs, runs the same Deepgram + Gemini pipeline as
+`/process-lecture`, and records the result. Claimed jobs carry a lease that
+the worker renews while it runs the job, so jobs held by a worker that
+crashed are picked up again once it expires, while long (segmented or
+transcoded) jobs are not.
+"""
+import os
+import asyncio
+import argparse
+import signal
+import traceback
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import or_, and_
+
+from backend.database import (
+    init_db,
+    SessionLocal,
+    AsyncSessionLocal,
+    close_async_db,
+    LectureJob,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_DONE,
+    JOB_ERROR,
+)
+from backend.pipeline import (
+    ensure_api_keys,
+    describe_pipeline_error,
+    transcribe_audio,
+    summarize_transcript,
+    save_lecture_result,
+)
+from backend.cache import result_cache, lookup_cached_result
+from backend.http_client import close_http_client
+from backend.result_writer import result_writer
+from backend.metrics import record_error
+
+# How long a claimed job may run before another worker may reclaim it
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "1800"))
+# How often a running job's lease is extended
+JOB_LEASE_RENEW_SECONDS = float(os.getenv("JOB_LEASE_RENEW_SECONDS", str(JOB_LEASE_SECONDS / 3)))
+# How many times a job is attempted before it is marked as failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Status codes worth retrying (upstream timeouts and connection errors)
+RETRYABLE_STATUS_CODES = {503, 504}
+
+
+def claim_next_job() -> Optional[LectureJob]:
+    """
+    Atomically claims the oldest queued job (or a running job whose lease has
+    expired) and returns it, or None if there is nothing to do.
+    """
+    db = SessionLocal()
+    try:
+        while True:
+            now = datetime.utcnow()
+            candidate = (
+                db.query(LectureJob)
+                .filter(or_(
+                    LectureJob.status == JOB_QUEUED,
+                    and_(LectureJob.status == JOB_RUNNING, LectureJob.lease_expires_at < now),
+                ))
+                .order_by(LectureJob.id)
+                .first()
+            )
+            if not candidate:
+                return None
+
+            if candidate.attempts >= JOB_MAX_ATTEMPTS:
+                candidate.status = JOB_ERROR
+                candidate.error = candidate.error or f"Job abandoned after {candidate.attempts} attempts."
+                candidate.updated_at = now
+                db.commit()
+                _remove_spool_file(candidate.file_path)
+                continue
+
+            # Compare-and-set on attempts so two workers can't claim the same job
+            claimed = (
+                db.query(LectureJob)
+                .filter(LectureJob.id == candidate.id, LectureJob.attempts == candidate.attempts)
+                .update({
+                    LectureJob.status: JOB_RUNNING,
+                    LectureJob.attempts: candidate.attempts + 1,
+                    LectureJob.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    LectureJob.updated_at: now,
+                }, synchronize_session=False)
+            )
+            db.commit()
+            if claimed == 1:
+                db.refresh(candidate)
+                db.expunge(candidate)
+                return candidate
+    finally:
+        db.close()
+
+
+def _owned_job(db, job: LectureJob):
+    # A claim is identified by its attempt number: reclaiming the job increments it
+    return db.query(LectureJob).filter(
+        LectureJob.id == job.id, LectureJob.status == JOB_RUNNING, LectureJob.attempts == job.attempts
+    )
+
+
+def renew_lease(job: LectureJob) -> bool:
+    """Extends the lease of a claimed job. Returns False if another worker has reclaimed it."""
+    db = SessionLocal()
+    try:
+        renewed = _owned_job(db, job).update({
+            LectureJob.lease_expires_at: datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS),
+        }, synchronize_session=False)
+        db.commit()
+        return renewed == 1
+    finally:
+        db.close()
+
+
+def finish_job(job: LectureJob, status: str, upload_id: Optional[int] = None, error: Optional[str] = None) -> bool:
+    """
+    Records the final (or requeued) state of a claimed job, provided this
+    claim still holds it. Returns False (and changes nothing) if the lease
+    was lost and another worker has reclaimed the job.
+    """
+    db = SessionLocal()
+    try:
+        finished = _owned_job(db, job).update({
+            LectureJob.status: status,
+            LectureJob.upload_id: upload_id,
+            LectureJob.error: error,
+            LectureJob.lease_expires_at: None,
+            LectureJob.updated_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if finished != 1:
+        print(f"Warning: Lost the lease on job {job.id} (attempt {job.attempts}); leaving it to its new owner")
+    return finished == 1
+
+
+async def keep_lease(job: LectureJob):
+    """Renews the job's lease every JOB_LEASE_RENEW_SECONDS until cancelled or the lease is lost."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_RENEW_SECONDS)
+        try:
+            if not await asyncio.to_thread(renew_lease, job):
+                return
+        except Exception as e:
+            # Try again next time; the lease only lapses after JOB_LEASE_SECONDS
+            print(f"Warning: Failed to renew the lease on job {job.id}: {e}")
+
+
+def _remove_spool_file(file_path: str):
+    if file_path and os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except Exception as cleanup_error:
+            print(f"Warning: Failed to clean up spooled file: {cleanup_error}")
+
+
+async def process_job(job: LectureJob):
+    """Runs the pipeline for a claimed job and stores the outcome, renewing its lease meanwhile."""
+    print(f"Processing job {job.id} (attempt {job.attempts}): {job.filename}")
+    heartbeat = asyncio.create_task(keep_lease(job))
+    try:
+        await _run_job(job)
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+
+
+async def _run_job(job: LectureJob):
+    try:
+        if not os.path.exists(job.file_path):
+            raise HTTPException(status_code=410, detail="Uploaded audio is no longer available on the server.")
+
+        async with AsyncSessionLocal() as db:
+            cached = await lookup_cached_result(db, job.content_hash)
+
+        if cached and cached["id"] is not None:
+            upload_id = cached["id"]
+            print(f"Cache hit for job {job.id} (upload ID {upload_id})")
+        else:
+            if cached:
+                transcript, notes = cached["transcript"], cached["notes"]
+                word_timings = None
+            else:
+                ensure_api_keys()
+                transcript, word_timings = await transcribe_audio(job.file_path, job.filename, job.file_type,
+                                                                  job.file_size)
+                notes = await summarize_transcript(transcript)
+
+            upload_id = await save_lecture_result(job.filename, job.file_size, job.file_type,
+                                                  transcript, notes, job.content_hash, word_timings,
+                                                  notes_generated=not cached)
+            if upload_id is None:
+                # Keep the (expensive) result around for the retry
+                result_cache.put(job.content_hash, transcript, notes)
+            elif cached:
+                result_cache.discard(job.content_hash)
+        if upload_id is None:
+            raise HTTPException(status_code=503, detail="Failed to save the result to the database.")
+
+        if finish_job(job, JOB_DONE, upload_id=upload_id):
+            _remove_spool_file(job.file_path)
+            print(f"Job {job.id} done (upload ID {upload_id})")
+    except asyncio.CancelledError:
+        # Worker is shutting down; hand the job back to the queue
+        finish_job(job, JOB_QUEUED)
+        raise
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            status_code, error = e.status_code, e.detail
+        else:
+            print(traceback.format_exc())
+            status_code, error = describe_pipeline_error(e)
+        print(f"Job {job.id} failed: {error}")
+        record_error("worker", status_code)
+
+        if status_code in RETRYABLE_STATUS_CODES and job.attempts < JOB_MAX_ATTEMPTS:
+            finish_job(job, JOB_QUEUED, error=error)
+        elif finish_job(job, JOB_ERROR, error=error):
+            _remove_spool_file(job.file_path)
+
+
+async def worker_loop(worker_id: int, stop_event: asyncio.Event, poll_interval: float):
+    """Claims and processes jobs until `stop_event` is set."""
+    while not stop_event.is_set():
+        try:
+            job = await asyncio.to_thread(claim_next_job)
+        except Exception as e:
+            print(f"Worker {worker_id}: failed to claim job: {e}")
+            job = None
+
+        if job is None:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        await process_job(job)
+
+
+async def run_worker(concurrency: int, poll_interval: float):
+    """Runs a pool of `concurrency` worker loops until SIGINT/SIGTERM."""
+    init_db()
+    stop_event = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: fall back to KeyboardInterrupt
+            pass
+
+    print(f"Worker started with concurrency {concurrency}")
+    tasks = [asyncio.create_task(worker_loop(i, stop_event, poll_interval)) for i in range(concurrency)]
+    try:
+        await stop_event.wait()
+        print("Shutting down worker, waiting for in-flight jobs...")
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_http_client()
+        await result_writer.close()
+        await close_async_db()
+    print("Worker stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued lecture jobs.")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "2")),
+                        help="Number of jobs processed in parallel (default: 2)")
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("WORKER_POLL_INTERVAL", "1.0")),
+                        help="Seconds to wait between polls when the queue is empty (default: 1.0)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_worker(args.concurrency, args.poll_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Cold-start import report for the Vercel entrypoint.
+
+Imports `api.index` (which imports `backend.main`) in fresh interpreters
+with `python -X importtime`, then prints the time spent in each package and
+the slowest modules. It exits non-zero when a module that should load lazily
+(the Deepgram SDK, google-genai) is imported at startup, and with --max-ms
+also when the median cold import is slower than the cap.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --runs 5 --max-ms 1500
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the request path loads on first use only; importing them at startup is a regression
+LAZY_MODULES = ("deepgram", "google.genai", "aiohttp")
+
+_PROBE = (
+    "import sys, json, {module}; "
+    "print(json.dumps(sorted(m for m in {lazy!r} if m in sys.modules)))"
+)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Parses `-X importtime` output into (module, self us, cumulative us, depth) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(module: str) -> Tuple[List[Tuple[str, int, int, int]], List[str]]:
+    """Imports `module` once in a fresh interpreter; returns its import rows and any lazy modules it loaded."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    # Run from a scratch directory so nothing (e.g. a SQLite file) lands in the repo
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, lazy=LAZY_MODULES)],
+            env=env, cwd=workdir, capture_output=True, text=True,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return parse_importtime(result.stderr), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report (and optionally cap) the cold import time of the app.")
+    parser.add_argument("--module", default="api.index", help="Module to import (default: api.index)")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to time (default: 3)")
+    parser.add_argument("--top", type=int, default=15, help="Modules to list (default: 15)")
+    parser.add_argument("--max-ms", type=float, help="Fail if the median cold import takes longer")
+    parser.add_argument("--json", dest="json_path", help="Also save the report as JSON")
+    args = parser.parse_args()
+
+    totals: List[float] = []
+    packages: Dict[str, List[int]] = {}
+    self_times: Dict[str, List[int]] = {}
+    loaded_lazy = set()
+    for _ in range(max(1, args.runs)):
+        rows, loaded = measure(args.module)
+        loaded_lazy.update(loaded)
+        run_packages: Dict[str, int] = {}
+        for name, self_us, cumulative_us, _ in rows:
+            if name == args.module:
+                totals.append(cumulative_us / 1000)
+            self_times.setdefault(name, []).append(self_us)
+            package = name.split(".")[0]
+            run_packages[package] = run_packages.get(package, 0) + self_us
+        for package, us in run_packages.items():
+            packages.setdefault(package, []).append(us)
+
+    median_ms = statistics.median(totals)
+    top_packages = sorted(((statistics.median(v) / 1000, k) for k, v in packages.items()), reverse=True)[:args.top]
+    top_self = sorted(((statistics.median(v) / 1000, k) for k, v in self_times.items()), reverse=True)[:args.top]
+
+    print(f"Cold import of {args.module}: median {median_ms:.0f} ms over {len(totals)} runs "
+          f"(min {min(totals):.0f}, max {max(totals):.0f})")
+    print(f"\nSlowest packages (self time of all their modules):")
+    for ms, name in top_packages:
+        print(f"  {ms:8.1f} ms  {name}")
+    print(f"\nSlowest modules (self):")
+    for ms, name in top_self:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "module": args.module,
+                "runs_ms": totals,
+                "median_ms": median_ms,
+                "top_packages_ms": {name: ms for ms, name in top_packages},
+                "top_self_ms": {name: ms for ms, name in top_self},
+                "lazy_modules_loaded": sorted(loaded_lazy),
+            }, f, indent=2)
+
+    failures = []
+    if loaded_lazy:
+        failures.append(f"modules that should load lazily were imported at startup: {', '.join(sorted(loaded_lazy))}")
+    if args.max_ms is not None and median_ms > args.max_ms:
+        failures.append(f"median cold import {median_ms:.0f} ms exceeds the {args.max_ms:.0f} ms cap")
+    if failures:
+        for failure in failures:
+            print(f"\nFAIL: {failure}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
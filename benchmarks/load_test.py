@@ -0,0 +1,322 @@
+"""
+Offline load test for the backend.
+
+Starts the Deepgram/Gemini stub server and the app (each in its own
+process, the app with a throwaway database), then runs each scenario:
+
+    uploads   concurrent POST /process-lecture (or /process-lecture/stream)
+              with unique audio, so every request runs the full pipeline
+    history   concurrent GET /history?mode=list once the uploads are stored
+
+and reports requests/s, p50/p95/p99 latency and the app's peak RSS. The
+report is saved as JSON (benchmarks/results/ by default); pass --compare
+with an earlier report to see the change.
+
+    python -m benchmarks.load_test --uploads 200 --concurrency 20 --deepgram-latency 2
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def read_rss_kb(pid: int, field: str = "VmRSS") -> Optional[int]:
+    """Reads a memory figure (VmRSS, or VmHWM for the peak) from /proc; None off Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """Tracks the peak RSS of a process while a scenario runs."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            rss = read_rss_kb(self.pid)
+            if rss:
+                self.peak_kb = max(self.peak_kb, rss)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        if self.pid:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        if self._task:
+            self._task.cancel()
+
+    @property
+    def peak_mb(self) -> Optional[float]:
+        return round(self.peak_kb / 1024, 1) if self.peak_kb else None
+
+
+def summarize(name: str, latencies: List[float], statuses: Dict[str, int], elapsed: float,
+              concurrency: int, peak_rss_mb: Optional[float]) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    ok = statuses.get("200", 0)
+    total = sum(statuses.values())
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "scenario": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "ok": ok,
+        "errors": total - ok,
+        "status_codes": statuses,
+        "duration_s": round(elapsed, 3),
+        "requests_per_s": round(total / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(latencies[-1] if latencies else None),
+            "mean": ms(sum(latencies) / len(latencies) if latencies else None),
+        },
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+async def run_scenario(name: str, total: int, concurrency: int, make_request, pid: Optional[int]) -> Dict[str, Any]:
+    """Runs `make_request(client, i)` `total` times with `concurrency` in flight."""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = 0
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0),
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal next_index
+            while next_index < total:
+                index = next_index
+                next_index += 1
+                start = time.perf_counter()
+                try:
+                    status = await make_request(client, index)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        with RssSampler(pid) as sampler:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+    report = summarize(name, latencies, statuses, elapsed, concurrency, sampler.peak_mb)
+    print_report(report)
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["latency_ms"]
+    print(f"  {report['scenario']:<8} {report['requests']:>6} req  {report['requests_per_s']:>8} req/s  "
+          f"p50 {latency['p50']} ms  p95 {latency['p95']} ms  p99 {latency['p99']} ms  "
+          f"errors {report['errors']}  peak RSS {report['peak_rss_mb']} MB")
+
+
+def upload_request(base_url: str, endpoint: str, file_size: int):
+    async def make_request(client: httpx.AsyncClient, index: int):
+        # Unique bytes per request so the result cache never short-circuits the pipeline
+        audio = index.to_bytes(8, "big") + os.urandom(max(0, file_size - 8))
+        response = await client.post(
+            f"{base_url}/{endpoint}",
+            files={"file": (f"bench_{index}.mp3", audio, "audio/mpeg")},
+        )
+        if endpoint.endswith("/stream") and response.status_code == 200 and "event: done" not in response.text:
+            return "stream_error"
+        return response.status_code
+    return make_request
+
+
+def history_request(base_url: str, page_size: int):
+    async def make_request(client: httpx.AsyncClient, index: int):
+        response = await client.get(f"{base_url}/history", params={"mode": "list", "limit": page_size})
+        return response.status_code
+    return make_request
+
+
+def start_process(args: List[str], env: Dict[str, str], cwd: str, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(args, env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def stop_process(process: Optional[subprocess.Popen]):
+    if process and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path: str, report: Dict[str, Any]):
+    with open(previous_path) as f:
+        previous = {s["scenario"]: s for s in json.load(f)["scenarios"]}
+    print(f"\nCompared with {previous_path}:")
+    for scenario in report["scenarios"]:
+        before = previous.get(scenario["scenario"])
+        if not before:
+            continue
+        for label, key in (("req/s", ("requests_per_s",)), ("p95 ms", ("latency_ms", "p95")),
+                           ("p99 ms", ("latency_ms", "p99")), ("peak RSS MB", ("peak_rss_mb",))):
+            old, new = before, scenario
+            for part in key:
+                old, new = (old or {}).get(part), (new or {}).get(part)
+            if old and new is not None:
+                print(f"  {scenario['scenario']:<8} {label:<12} {old:>10} -> {new:<10} ({(new - old) / old * 100:+.1f}%)")
+
+
+async def run(args) -> Dict[str, Any]:
+    stub = app = None
+    workdir = tempfile.mkdtemp(prefix="lecture_bench_")
+    try:
+        env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+        if args.app_url:
+            base_url, app_pid = args.app_url.rstrip("/"), None
+        else:
+            stub_port, app_port = free_port(), free_port()
+            stub_url = f"http://127.0.0.1:{stub_port}"
+            stub = start_process([
+                sys.executable, "-m", "benchmarks.stub_servers", "--port", str(stub_port),
+                "--deepgram-latency", str(args.deepgram_latency), "--gemini-latency", str(args.gemini_latency),
+                "--transcript-words", str(args.transcript_words), "--failure-rate", str(args.failure_rate),
+            ], env, REPO_ROOT, os.path.join(workdir, "stub.log"))
+            wait_until_ready(f"{stub_url}/v1/projects", stub)
+
+            app_env = dict(
+                env,
+                DEEPGRAM_API_KEY="bench", GEMINI_API_KEY="bench",
+                DEEPGRAM_API_URL=stub_url, GEMINI_API_URL=stub_url,
+                RATE_LIMIT_ENABLED="false", SEGMENTATION_ENABLED="false",
+                RESULT_CACHE_DIR=os.path.join(workdir, "cache"),
+            )
+            # Run from the scratch directory so the app creates a fresh lecture_notes.db there
+            app = start_process([
+                sys.executable, "-m", "uvicorn", "backend.main:app",
+                "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning",
+            ], app_env, workdir, os.path.join(workdir, "app.log"))
+            base_url, app_pid = f"http://127.0.0.1:{app_port}", app.pid
+            wait_until_ready(f"{base_url}/metrics", app)
+            print(f"App at {base_url}, stubs at {stub_url}, logs in {workdir}")
+
+        scenarios = []
+        if args.uploads:
+            scenarios.append(await run_scenario(
+                "uploads", args.uploads, args.concurrency,
+                upload_request(base_url, args.endpoint, args.file_size_kb * 1024), app_pid,
+            ))
+        if args.history_reads:
+            scenarios.append(await run_scenario(
+                "history", args.history_reads, args.history_concurrency,
+                history_request(base_url, args.history_page_size), app_pid,
+            ))
+
+        return {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_commit": git_commit(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "app_peak_rss_mb": round(read_rss_kb(app_pid, "VmHWM") / 1024, 1)
+            if app_pid and read_rss_kb(app_pid, "VmHWM") else None,
+            "scenarios": scenarios,
+        }
+    finally:
+        stop_process(app)
+        stop_process(stub)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the backend against local Deepgram/Gemini stubs.")
+    parser.add_argument("--uploads", type=int, default=100, help="Upload requests to send (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Uploads in flight (default: 10)")
+    parser.add_argument("--endpoint", default="process-lecture",
+                        choices=("process-lecture", "process-lecture/stream"))
+    parser.add_argument("--file-size-kb", type=int, default=512, help="Size of each upload (default: 512)")
+    parser.add_argument("--history-reads", type=int, default=500, help="History requests to send (default: 500)")
+    parser.add_argument("--history-concurrency", type=int, default=20, help="History reads in flight (default: 20)")
+    parser.add_argument("--history-page-size", type=int, default=50)
+    parser.add_argument("--deepgram-latency", type=float, default=1.0, help="Stub Deepgram latency in seconds")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Stub Gemini latency in seconds")
+    parser.add_argument("--transcript-words", type=int, default=2000, help="Words per stub transcript")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of stub calls that return 503")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app (default: 1)")
+    parser.add_argument("--app-url", help="Benchmark an already running app instead of starting one")
+    parser.add_argument("--output", help="Where to save the JSON report (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.utcnow().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved report to {output}")
+
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Local stand-ins for the Deepgram and Gemini APIs, for offline benchmarks.
+
+One server answers both APIs:
+
+    POST /v1/listen                                   Deepgram pre-recorded transcription
+    GET  /v1/projects                                 Deepgram key check (/test-deepgram)
+    POST /v1beta/models/{model}:generateContent       Gemini
+    POST /v1beta/models/{model}:streamGenerateContent Gemini (SSE, used by /process-lecture/stream)
+
+Point the backend at it with DEEPGRAM_API_URL and GEMINI_API_URL:
+
+    python -m benchmarks.stub_servers --port 9100 --deepgram-latency 2 --gemini-latency 1.5
+    DEEPGRAM_API_URL=http://127.0.0.1:9100 GEMINI_API_URL=http://127.0.0.1:9100 uvicorn backend.main:app
+"""
+import os
+import json
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Stub behaviour, read from the environment so it survives uvicorn's import of the app
+STUB_DEEPGRAM_LATENCY = float(os.getenv("STUB_DEEPGRAM_LATENCY", "1.0"))
+STUB_GEMINI_LATENCY = float(os.getenv("STUB_GEMINI_LATENCY", "1.0"))
+# Words in each transcript / notes response
+STUB_TRANSCRIPT_WORDS = int(os.getenv("STUB_TRANSCRIPT_WORDS", "2000"))
+STUB_NOTES_WORDS = int(os.getenv("STUB_NOTES_WORDS", "400"))
+# Fraction of requests answered with a 503
+STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+# Pieces a streamed Gemini response is split into (spread over its latency)
+STUB_STREAM_CHUNKS = int(os.getenv("STUB_STREAM_CHUNKS", "8"))
+
+WORDS = ("lecture", "energy", "system", "model", "student", "theory", "example", "function",
+         "process", "result", "question", "analysis", "structure", "method", "concept", "data")
+
+app = FastAPI(title="Deepgram/Gemini stub")
+
+
+def _sentence_text(word_count: int) -> str:
+    words = []
+    for i in range(word_count):
+        word = random.choice(WORDS)
+        words.append(word + ("." if i % 12 == 11 else ""))
+    return " ".join(words)
+
+
+def _failure() -> JSONResponse:
+    return JSONResponse({"error": {"code": 503, "message": "stub: simulated outage", "status": "UNAVAILABLE"}},
+                        status_code=503)
+
+
+@app.post("/v1/listen")
+async def listen(request: Request):
+    # Read (and discard) the upload like the real API would
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+    await asyncio.sleep(STUB_DEEPGRAM_LATENCY)
+    if random.random() < STUB_FAILURE_RATE:
+        return _failure()
+
+    transcript = _sentence_text(STUB_TRANSCRIPT_WORDS)
+    words = [
+        {"word": w.strip("."), "start": round(i * 0.4, 3), "end": round(i * 0.4 + 0.35, 3), "confidence": 0.95}
+        for i, w in enumerate(transcript.split())
+    ]
+    return {
+        "metadata": {"request_id": "stub", "duration": len(words) * 0.4, "channels": 1, "bytes": received},
+        "results": {"channels": [{"alternatives": [{
+            "transcript": transcript,
+            "confidence": 0.95,
+            "words": words,
+        }]}]},
+    }
+
+
+@app.get("/v1/projects")
+async def projects():
+    return {"projects": [{"project_id": "stub", "name": "stub"}]}
+
+
+def _gemini_payload(text: str, finished: bool = True) -> dict:
+    payload = {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "index": 0,
+        }],
+        "modelVersion": "stub",
+    }
+    if finished:
+        payload["candidates"][0]["finishReason"] = "STOP"
+        payload["usageMetadata"] = {"promptTokenCount": 0, "candidatesTokenCount": STUB_NOTES_WORDS}
+    return payload
+
+
+def _notes_text() -> str:
+    return (
+        "1.  **One-Sentence Summary**: " + _sentence_text(20) + "\n"
+        "2.  **Key Takeaways**:\n" + _sentence_text(max(0, STUB_NOTES_WORDS - 20))
+    )
+
+
+@app.post("/{version}/models/{model_action}")
+async def gemini(version: str, model_action: str, request: Request):
+    await request.body()
+    if random.random() < STUB_FAILURE_RATE:
+        await asyncio.sleep(STUB_GEMINI_LATENCY)
+        return _failure()
+
+    notes = _notes_text()
+    if model_action.endswith(":streamGenerateContent"):
+        async def events():
+            pieces = max(1, STUB_STREAM_CHUNKS)
+            step = -(-len(notes) // pieces)
+            for i in range(pieces):
+                await asyncio.sleep(STUB_GEMINI_LATENCY / pieces)
+                chunk = notes[i * step:(i + 1) * step]
+                yield f"data: {json.dumps(_gemini_payload(chunk, finished=i == pieces - 1))}\r\n\r\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(STUB_GEMINI_LATENCY)
+    return _gemini_payload(notes)
+
+
+def main():
+    global STUB_DEEPGRAM_LATENCY, STUB_GEMINI_LATENCY, STUB_TRANSCRIPT_WORDS, STUB_NOTES_WORDS, STUB_FAILURE_RATE
+    parser = argparse.ArgumentParser(description="Run the Deepgram/Gemini stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--deepgram-latency", type=float, default=STUB_DEEPGRAM_LATENCY,
+                        help="Seconds before a transcription response (default: 1.0)")
+    parser.add_argument("--gemini-latency", type=float, default=STUB_GEMINI_LATENCY,
+                        help="Seconds before a summary response (default: 1.0)")
+    parser.add_argument("--transcript-words", type=int, default=STUB_TRANSCRIPT_WORDS,
+                        help="Words per transcript (default: 2000)")
+    parser.add_argument("--notes-words", type=int, default=STUB_NOTES_WORDS,
+                        help="Words per summary (default: 400)")
+    parser.add_argument("--failure-rate", type=float, default=STUB_FAILURE_RATE,
+                        help="Fraction of requests answered with 503 (default: 0)")
+    args = parser.parse_args()
+
+    STUB_DEEPGRAM_LATENCY = args.deepgram_latency
+    STUB_GEMINI_LATENCY = args.gemini_latency
+    STUB_TRANSCRIPT_WORDS = args.transcript_words
+    STUB_NOTES_WORDS = args.notes_words
+    STUB_FAILURE_RATE = args.failure_rate
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,6 @@ def check_dependencies():
     required_packages = [
         'fastapi',
         'uvicorn',
-        'deepgram',
         'google.genai',
         'dotenv',
         'aiofiles',
@@ -0,0 +1,44 @@
+"""
+Shared setup for the API tests: the app runs in-process against a fresh
+database and temp directories, with Deepgram and Gemini replaced by stubs.
+"""
+import os
+import asyncio
+import tempfile
+
+import pytest
+
+# Must be in place before the backend is imported (settings are read at import time)
+_WORK_DIR = tempfile.mkdtemp(prefix="lecture_tests_")
+os.chdir(_WORK_DIR)  # The database is ./lecture_notes.db
+os.environ.setdefault("DEEPGRAM_API_KEY", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ["RESUMABLE_UPLOAD_DIR"] = os.path.join(_WORK_DIR, "uploads")
+os.environ["JOB_SPOOL_DIR"] = os.path.join(_WORK_DIR, "spool")
+os.environ["RESULT_CACHE_DIR"] = os.path.join(_WORK_DIR, "result_cache")
+
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend import rate_limit
+
+
+async def fake_transcribe_audio(file_path, filename, content_type, file_size, audio_file=None):
+    await asyncio.sleep(0.01)
+    return f"Transcript of {filename} ({file_size} bytes)", None
+
+
+async def fake_summarize_transcript(transcript):
+    return f"Notes for: {transcript}"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "transcribe_audio", fake_transcribe_audio)
+    monkeypatch.setattr(main, "summarize_transcript", fake_summarize_transcript)
+    # Empty the (memory) limiter per test, so earlier requests don't use up this one's tokens
+    store = rate_limit.get_store()
+    monkeypatch.setattr(store, "_buckets", {})
+    monkeypatch.setattr(store, "_slots", {})
+    with TestClient(main.app) as test_client:
+        yield test_client
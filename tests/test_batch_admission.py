@@ -0,0 +1,36 @@
+import json
+import os
+
+from backend import rate_limit
+
+
+def post_batch(client, count: int):
+    files = [("files", (f"lecture{i}.mp3", os.urandom(1000 + i), "audio/mpeg")) for i in range(count)]
+    response = client.post("/process-lectures", files=files)
+    assert response.status_code == 200, response.text
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return [line for line in lines if line["type"] == "result"], lines[-1]
+
+
+def test_batch_larger_than_burst_waits_for_tokens(client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BURST", 2)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_PER_MINUTE", 600)  # a token every 0.1s
+    monkeypatch.setattr(rate_limit, "MAX_CONCURRENT_PIPELINES", 1)
+    monkeypatch.setattr(rate_limit, "PIPELINE_SLOT_POLL_SECONDS", 0.01)
+
+    results, summary = post_batch(client, 6)
+    assert sorted(result["status_code"] for result in results) == [200] * 6
+    assert summary == {"type": "summary", "status": "ok", "total": 6, "succeeded": 6, "failed": 0}
+    assert rate_limit.get_store()._slots == {}
+
+
+def test_batch_file_refused_after_admission_deadline(client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BURST", 1)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_PER_MINUTE", 1)
+    monkeypatch.setattr(rate_limit, "BATCH_ADMISSION_TIMEOUT_SECONDS", 0.5)
+
+    results, summary = post_batch(client, 3)
+    assert summary["succeeded"] == 1
+    refused = [result for result in results if result["status_code"] == 429]
+    assert len(refused) == 2
+    assert all(result["retry_after"] > 0 for result in refused)
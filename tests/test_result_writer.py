@@ -0,0 +1,33 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from backend.cache import lookup_cached_notes, notes_cache_key
+from backend.database import AsyncSessionLocal, NotesCacheEntry, close_async_db, init_db
+from backend.result_writer import ResultWriter, lecture_row
+
+
+def test_notes_cache_is_written_in_the_batch_transaction():
+    init_db()
+
+    async def run():
+        writer = ResultWriter(batch_size=32, flush_interval=0.05)
+        transcripts = [f"writer test transcript {i}" for i in range(8)]
+        ids = await asyncio.gather(*(
+            writer.save(lecture_row(f"l{i}.mp3", 100, "audio/mpeg", transcript, f"notes {i}",
+                                    notes_key=notes_cache_key(transcript)))
+            for i, transcript in enumerate(transcripts)
+        ))
+        await writer.close()
+        async with AsyncSessionLocal() as db:
+            notes = [await lookup_cached_notes(db, notes_cache_key(t)) for t in transcripts]
+            count = (await db.execute(select(func.count(NotesCacheEntry.id)))).scalar()
+        await close_async_db()
+        return writer, ids, notes, count
+
+    writer, ids, notes, count = asyncio.run(run())
+    assert None not in ids
+    # One transaction for all eight rows and their notes cache entries
+    assert writer.batches == 1
+    assert notes == [f"notes {i}" for i in range(8)]
+    assert count >= 8
@@ -0,0 +1,37 @@
+import os
+
+from backend import segmenter
+
+
+def upload_in_chunks(client, data: bytes, filename: str = "lecture.mp3"):
+    response = client.post("/uploads", json={"filename": filename, "size": len(data)})
+    assert response.status_code == 201, response.text
+    upload = response.json()
+    chunk_size = upload["chunk_size"]
+    for index in range(upload["total_chunks"]):
+        chunk = data[index * chunk_size:(index + 1) * chunk_size]
+        response = client.put(f"/uploads/{upload['upload_id']}/chunks/{index}", content=chunk)
+        assert response.status_code == 200, response.text
+    return upload
+
+
+def test_upload_over_request_limit_without_ffmpeg(client, monkeypatch):
+    # The Vercel case: no ffmpeg, so single requests are capped at MAX_FILE_SIZE_MB (4MB)
+    monkeypatch.setattr(segmenter, "ffmpeg_available", lambda: False)
+    data = os.urandom(10 * 1024 * 1024)
+    upload = upload_in_chunks(client, data)
+    assert upload["total_chunks"] > 1
+
+    response = client.post(f"/uploads/{upload['upload_id']}/finalize", params={"mode": "sync"})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["status"] == "ok"
+    assert result["transcript"] == f"Transcript of lecture.mp3 ({len(data)} bytes)"
+
+
+def test_upload_over_resumable_limit_is_refused(client, monkeypatch):
+    monkeypatch.setattr(segmenter, "ffmpeg_available", lambda: False)
+    monkeypatch.setattr("backend.pipeline.MAX_RESUMABLE_UPLOAD_MB", 8)
+    response = client.post("/uploads", json={"filename": "lecture.mp3", "size": 9 * 1024 * 1024})
+    assert response.status_code == 413
+    assert "8MB" in response.json()["detail"]
@@ -0,0 +1,87 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from backend import worker
+from backend.database import JOB_DONE, JOB_QUEUED, JOB_RUNNING, LectureJob, SessionLocal, close_async_db, init_db
+
+
+def queue_job(tmp_path) -> int:
+    init_db()
+    file_path = tmp_path / "lecture.mp3"
+    file_path.write_bytes(os.urandom(2000))
+    db = SessionLocal()
+    try:
+        # Earlier tests' jobs would otherwise be claimed first
+        db.query(LectureJob).delete()
+        job = LectureJob(status=JOB_QUEUED, filename="lecture.mp3", file_size=2000, file_type="audio/mpeg",
+                         file_path=str(file_path), content_hash=os.urandom(32).hex())
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def job_row(job_id: int) -> LectureJob:
+    db = SessionLocal()
+    try:
+        return db.get(LectureJob, job_id)
+    finally:
+        db.close()
+
+
+def test_lease_is_renewed_while_a_long_job_runs(tmp_path, monkeypatch):
+    job_id = queue_job(tmp_path)
+    monkeypatch.setattr(worker, "JOB_LEASE_SECONDS", 1)
+    monkeypatch.setattr(worker, "JOB_LEASE_RENEW_SECONDS", 0.2)
+    reclaimed = []
+
+    async def slow_transcribe(file_path, filename, content_type, file_size):
+        # Outlives the lease several times over; nobody may reclaim the job meanwhile
+        for _ in range(6):
+            await asyncio.sleep(0.5)
+            reclaimed.append(await asyncio.to_thread(worker.claim_next_job))
+        return "A long lecture", None
+
+    async def summarize(transcript):
+        return "Notes"
+
+    monkeypatch.setattr(worker, "transcribe_audio", slow_transcribe)
+    monkeypatch.setattr(worker, "summarize_transcript", summarize)
+
+    async def run():
+        job = await asyncio.to_thread(worker.claim_next_job)
+        assert job.id == job_id
+        await worker.process_job(job)
+        await worker.result_writer.close()
+        await close_async_db()
+
+    asyncio.run(run())
+    assert reclaimed == [None] * 6
+    row = job_row(job_id)
+    assert row.status == JOB_DONE and row.attempts == 1 and row.upload_id is not None
+
+
+def test_finish_is_ignored_after_the_lease_was_lost(tmp_path):
+    job_id = queue_job(tmp_path)
+    first = worker.claim_next_job()
+
+    # The lease runs out and another worker reclaims the job
+    db = SessionLocal()
+    try:
+        db.query(LectureJob).filter(LectureJob.id == job_id).update(
+            {LectureJob.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+    finally:
+        db.close()
+    second = worker.claim_next_job()
+    assert second.id == job_id and second.attempts == 2
+
+    assert not worker.renew_lease(first)
+    assert not worker.finish_job(first, JOB_DONE, upload_id=123)
+    row = job_row(job_id)
+    assert row.status == JOB_RUNNING and row.upload_id is None
+
+    assert worker.finish_job(second, JOB_DONE, upload_id=456)
+    assert job_row(job_id).upload_id == 456
@@ -1,51 +1,70 @@
 """
 Simple script to view the lecture uploads database.
 Run this script to see all your uploaded lectures and their details.
+
+Uploads are read in batches through a server-side cursor, so it works the
+same on a database with thousands of lectures. Filter with --since, --until
+and --filename, e.g.:
+
+    python view_database.py --since 2025-01-01 --filename biology --limit 20
 """
 import os
 import sys
+import argparse
 from datetime import datetime
 
 # Add backend to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
 
+from sqlalchemy import func, select
+
 from backend.database import SessionLocal, LectureUpload
+from backend.export import export_query, filter_uploads
 
-def view_database():
-    """Display all lecture uploads from the database."""
+def preview(text: str, length: int = 100) -> str:
+    return text[:length] + "..." if len(text) > length else text
+
+def view_database(since=None, until=None, filename=None, limit=None, transcripts=True):
+    """Display the lecture uploads matching the filters, newest first."""
     db = SessionLocal()
     try:
-        uploads = db.query(LectureUpload).order_by(LectureUpload.created_at.desc()).all()
-        
-        if not uploads:
+        query = export_query(since, until, filename, transcripts, newest_first=True)
+        total = db.execute(filter_uploads(select(func.count(LectureUpload.id)), since, until, filename)).scalar()
+        if limit:
+            total = min(total, limit)
+            query = query.limit(limit)
+
+        if not total:
             print("\n📭 No uploads found in the database.")
             print("Upload some audio files to see them here!\n")
             return
-        
+
         print("\n" + "="*80)
-        print(f"📚 LECTURE UPLOADS DATABASE - {len(uploads)} total upload(s)")
+        print(f"📚 LECTURE UPLOADS DATABASE - {total} matching upload(s)")
         print("="*80 + "\n")
-        
-        for idx, upload in enumerate(uploads, 1):
+
+        shown = 0
+        # yield_per (set by export_query): rows arrive in batches instead of all at once
+        for upload in db.execute(query):
+            shown += 1
             print(f"📄 Upload #{upload.id}")
             print(f"   Filename: {upload.filename}")
             print(f"   Size: {upload.file_size / 1024 / 1024:.2f} MB")
             print(f"   Type: {upload.file_type}")
             print(f"   Uploaded: {upload.created_at.strftime('%Y-%m-%d %H:%M:%S') if upload.created_at else 'Unknown'}")
-            
+
             # Show transcript preview (first 100 characters)
-            transcript_preview = upload.transcript[:100] + "..." if len(upload.transcript) > 100 else upload.transcript
-            print(f"   Transcript Preview: {transcript_preview}")
-            
+            if transcripts:
+                print(f"   Transcript Preview: {preview(upload.transcript)}")
+
             # Show notes preview (first 100 characters)
-            notes_preview = upload.notes[:100] + "..." if len(upload.notes) > 100 else upload.notes
-            print(f"   Notes Preview: {notes_preview}")
-            
+            print(f"   Notes Preview: {preview(upload.notes)}")
+
             print("-" * 80)
             print()
-        
-        print(f"\n✅ Total: {len(uploads)} upload(s)\n")
-        
+
+        print(f"\n✅ Total: {shown} upload(s)\n")
+
     except Exception as e:
         print(f"\n❌ Error reading database: {e}\n")
         import traceback
@@ -54,4 +73,11 @@ def view_database():
         db.close()
 
 if __name__ == "__main__":
-    view_database()
+    parser = argparse.ArgumentParser(description="View stored lecture uploads.")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only uploads at or after this ISO date/time")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Only uploads before this ISO date/time")
+    parser.add_argument("--filename", help="Only uploads whose filename contains this text")
+    parser.add_argument("--limit", type=int, help="Show at most this many uploads")
+    parser.add_argument("--no-transcripts", action="store_true", help="Don't read or preview transcripts")
+    args = parser.parse_args()
+    view_database(args.since, args.until, args.filename, args.limit, not args.no_transcripts)